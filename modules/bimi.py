@@ -1,6 +1,7 @@
 # modules/bimi.py
 
-import dns.resolver
+from .lookup import resolve
+from .tags import parse_tags
 
 
 class BIMI:
@@ -8,11 +9,15 @@ class BIMI:
         self.domain = domain
         self.dns_server = dns_server
         self.bimi_record = self.get_bimi_record()
+        self.tags = {}
         self.version = None
         self.location = None
         self.authority = None
 
         if self.bimi_record:
+            self.tags = parse_tags(
+                b"".join(self.bimi_record.strings).decode("utf-8", "replace")
+            )
             self.version = self.get_bimi_version()
             self.location = self.get_bimi_location()
             self.authority = self.get_bimi_authority()
@@ -20,10 +25,8 @@ class BIMI:
     def get_bimi_record(self):
         """Returns the BIMI record for the domain."""
         try:
-            resolver = dns.resolver.Resolver()
-            if self.dns_server:
-                resolver.nameservers = [self.dns_server]
-            bimi = resolver.resolve(f"default._bimi.{self.domain}", "TXT")
+            nameservers = [self.dns_server] if self.dns_server else None
+            bimi = resolve(f"default._bimi.{self.domain}", "TXT", nameservers)
             for record in bimi:
                 if "v=BIMI" in str(record):
                     return record
@@ -33,21 +36,15 @@ class BIMI:
 
     def get_bimi_version(self):
         """Returns the version value from a BIMI record."""
-        if "v=" in str(self.bimi_record):
-            return str(self.bimi_record).split("v=")[1].split(";")[0]
-        return None
+        return self.tags.get("v")
 
     def get_bimi_location(self):
         """Returns the location value from a BIMI record."""
-        if "l=" in str(self.bimi_record):
-            return str(self.bimi_record).split("l=")[1].split(";")[0]
-        return None
+        return self.tags.get("l")
 
     def get_bimi_authority(self):
         """Returns the authority value from a BIMI record."""
-        if "a=" in str(self.bimi_record):
-            return str(self.bimi_record).split("a=")[1].split(";")[0]
-        return None
+        return self.tags.get("a")
 
     def get_bimi_details(self):
         """Returns a tuple containing version, location, and authority from a BIMI record."""
@@ -0,0 +1,108 @@
+# modules/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+import dns.rdatatype
+import dns.resolver
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_NEGATIVE_TTL = 300
+
+
+def negative_ttl(error, default=DEFAULT_NEGATIVE_TTL):
+    """Returns how long an NXDOMAIN or NoAnswer may be cached, from the SOA minimum (RFC 2308)."""
+    if isinstance(error, dns.resolver.NXDOMAIN):
+        responses = list(error.responses().values())
+    else:
+        responses = [error.kwargs.get("response")]
+
+    for response in responses:
+        if response is None:
+            continue
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return default
+
+
+class DNSCache:
+    """A process-wide, size-bounded cache of DNS answers that honors record TTLs.
+
+    observer, when set, is called with the key of every answer stored.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.observer = None
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(qname, rdtype, nameservers=None):
+        """Returns the cache key for a query sent to the given nameservers."""
+        return (
+            str(qname).lower().rstrip("."),
+            str(rdtype).upper(),
+            tuple(nameservers) if nameservers else None,
+        )
+
+    def get(self, key):
+        """Returns the cached RRset or negative-answer exception type for key, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if isinstance(value, type):
+                self.negative_hits += 1
+        return value
+
+    def put(self, key, value, ttl):
+        """Stores an RRset or negative-answer exception type for ttl seconds."""
+        if self.observer is not None:
+            self.observer(key)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drops every entry and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.negative_hits = self.evictions = 0
+
+    def stats(self):
+        """Returns the hit/miss counters of the cache."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+answer_cache = DNSCache()
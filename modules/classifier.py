@@ -0,0 +1,310 @@
+# modules/classifier.py
+
+import argparse
+import functools
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from .syntax import validate_record_syntax
+
+POLICIES = {"none": 1, "quarantine": 2, "reject": 3}
+ALLS = {"-all": 1, "?all": 2, "+all": 3, "~all": 4, "2many": 5}
+ASPFS = {"r": 1, "s": 2}
+# One value of every bucket of each input, in bucket order, in the order
+# decide() takes its arguments. The table holds decide() of each combination.
+REPRESENTATIVES = (
+    (None, 100, 50, "invalid"),  # pct: unset, 100, partial, not a number
+    (None, "", "v=spf1"),  # spf_record: none, empty, present
+    (0, 11, None),  # spf_dns_queries: at most 10, over 10, not a number
+    (None, "-all", "?all", "+all", "~all", "2many", "all"),  # spf_all
+    (None, "none", "quarantine", "reject", "other"),  # p
+    (None, "none", "quarantine", "reject", "other"),  # sp
+    (None, "r", "s", "other"),  # aspf
+    (None, "v=DMARC1"),  # dmarc_record: absent, present
+)
+SHAPE = tuple(len(values) for values in REPRESENTATIVES)
+INVALID = -1
+# What decide() raises on unusable inputs: int() of a pct that is not a
+# number (or is infinite), and comparing a query count that is not one.
+DECIDE_ERRORS = (TypeError, ValueError, OverflowError)
+# The report columns classify_frame() reads, in decide() argument order.
+FRAME_COLUMNS = (
+    "DMARC_PCT",
+    "SPF",
+    "SPF_NUM_DNS_QUERIES",
+    "SPF_MULTIPLE_ALLS",
+    "DMARC_POLICY",
+    "DMARC_SP",
+    "DMARC_ASPF",
+    "DMARC",
+)
+
+
+def decide(pct, spf_record, spf_dns_queries, spf_all, p, sp, aspf, dmarc_record):
+    """The spoofability decision tree; raises where the inputs are unusable."""
+    if pct and int(pct) != 100:
+        return 3
+    if spf_record is None:
+        return 0 if p is None else 4 if p == "none" else 8
+    if spf_dns_queries > 10 and p is None:
+        return 0
+    if spf_all == "2many":
+        return 3 if p == "none" else 8
+    if spf_all and p is None:
+        return 0
+    if spf_all == "-all":
+        if p == "none":
+            if sp == "none":
+                if aspf in ["r", "s"]:
+                    return 1
+                return 7
+            if sp in ["quarantine", "reject"]:
+                if aspf == "r":
+                    return 2
+                if aspf == "s":
+                    return 8
+                return 5
+            return 4
+        if p in ["quarantine", "reject"]:
+            if sp == "none":
+                if aspf in ["r", "s"]:
+                    return 8
+                return 1
+            return 8
+    if spf_all == "?all":
+        if not dmarc_record:
+            return 0
+        if p == "none" and aspf == "r":
+            return 0
+        if p == "none" and sp == "none" and aspf in ["r", "s"]:
+            return 4
+        if p == "none" and sp in ["quarantine", "reject"]:
+            return 5
+        return 8
+    if spf_all == "+all":
+        return 4
+    if spf_all == "~all":
+        if p == "none":
+            if sp == "none":
+                return 7 if aspf in ["r", "s"] else 0
+            if sp in ["quarantine", "reject"]:
+                return 2
+            return 2 if aspf in ["r", "s"] else 8
+
+        if p in ["quarantine", "reject"]:
+            if sp == "none":
+                return 8 if aspf in ["r", "s"] else 1
+            return 8
+    if not spf_all:
+        if not dmarc_record:
+            return 0
+        if p in ["quarantine", "reject"] and sp == "none" and aspf in ["r", "s"]:
+            return 1
+        if p == "none" and sp in ["none", "quarantine", "reject"]:
+            return 4 if aspf == "s" else 5
+        return 8
+    if not spf_record:
+        if not dmarc_record:
+            return 0
+        if p == "none" and sp == "none" and aspf in ["r", "s"]:
+            return 2
+        return 4 if p == "none" else 8
+    return 8
+
+
+def valid_syntax(record, record_type):
+    """Returns validate_record_syntax() of record, with a missing record invalid."""
+    return record is not None and validate_record_syntax(record, record_type)
+
+
+def decide_invalid(spf_valid, dmarc_valid, p_none):
+    """The spoofability of inputs decide() cannot use, from the syntax of the records."""
+    if not dmarc_valid:
+        return 0
+    return 3 if not spf_valid and p_none else 8
+
+
+@functools.lru_cache(maxsize=1)
+def decision_table():
+    """Returns decide() of every combination of input buckets, INVALID where it raises."""
+    table = np.empty(SHAPE, dtype=np.int8)
+    for index in np.ndindex(*SHAPE):
+        values = [REPRESENTATIVES[axis][i] for axis, i in enumerate(index)]
+        try:
+            table[index] = decide(*values)
+        except DECIDE_ERRORS:
+            table[index] = INVALID
+    return table.ravel()
+
+
+def _pct_bucket(pct):
+    if not pct:
+        return 0
+    try:
+        return 1 if int(pct) == 100 else 2
+    except DECIDE_ERRORS:
+        return 3
+
+
+def _spf_record_bucket(spf_record):
+    return 0 if spf_record is None else 2 if spf_record else 1
+
+
+def _spf_dns_queries_bucket(spf_dns_queries):
+    try:
+        return 1 if spf_dns_queries > 10 else 0
+    except DECIDE_ERRORS:
+        return 2
+
+
+def _spf_all_bucket(spf_all):
+    return ALLS.get(spf_all, 6) if spf_all else 0
+
+
+def _policy_bucket(policy):
+    return 0 if policy is None else POLICIES.get(policy, 4)
+
+
+def _aspf_bucket(aspf):
+    return 0 if aspf is None else ASPFS.get(aspf, 3)
+
+
+def _dmarc_record_bucket(dmarc_record):
+    return 1 if dmarc_record else 0
+
+
+BUCKETS = (
+    _pct_bucket,
+    _spf_record_bucket,
+    _spf_dns_queries_bucket,
+    _spf_all_bucket,
+    _policy_bucket,
+    _policy_bucket,
+    _aspf_bucket,
+    _dmarc_record_bucket,
+)
+STRIDES = tuple(int(np.prod(SHAPE[axis + 1 :])) for axis in range(len(SHAPE)))
+
+
+def spoofability(pct, spf_record, spf_dns_queries, spf_all, p, sp, aspf, dmarc_record):
+    """Returns the spoofability code of one domain from the decision table."""
+    values = (pct, spf_record, spf_dns_queries, spf_all, p, sp, aspf, dmarc_record)
+    index = sum(
+        bucket(value) * stride
+        for bucket, value, stride in zip(BUCKETS, values, STRIDES)
+    )
+    code = int(decision_table()[index])
+    if code == INVALID:
+        code = decide_invalid(
+            valid_syntax(spf_record, "SPF"),
+            valid_syntax(dmarc_record, "DMARC"),
+            p == "none",
+        )
+    return code
+
+
+def _bucket_column(column, bucket):
+    """Returns the bucket of every value of column, calling bucket once per distinct value."""
+    codes, uniques = pd.factorize(pd.Series(column, dtype=object))
+    # Missing values (None, NaN) get code -1, the last entry.
+    buckets = np.array([bucket(value) for value in uniques] + [bucket(None)])
+    return buckets[codes]
+
+
+def _valid_column(column, record_type):
+    codes, uniques = pd.factorize(pd.Series(column, dtype=object))
+    valid = [valid_syntax(value, record_type) for value in uniques]
+    return np.array(valid + [False])[codes]
+
+
+def classify(pct, spf_record, spf_dns_queries, spf_all, p, sp, aspf, dmarc_record):
+    """Returns the spoofability codes of columns of inputs as an int8 array.
+
+    Each argument is a sequence with one value per domain; missing values
+    (None or NaN) are read as None. Every column is bucketed once per
+    distinct value, so the cost is a few array operations per row.
+    """
+    columns = (pct, spf_record, spf_dns_queries, spf_all, p, sp, aspf, dmarc_record)
+    index = 0
+    for column, bucket, stride in zip(columns, BUCKETS, STRIDES):
+        index = index + _bucket_column(column, bucket) * stride
+    codes = decision_table()[np.asarray(index, dtype=np.intp)]
+    invalid = np.flatnonzero(codes == INVALID)
+    if len(invalid):
+        spf_valid = _valid_column(np.asarray(spf_record, dtype=object)[invalid], "SPF")
+        dmarc_valid = _valid_column(
+            np.asarray(dmarc_record, dtype=object)[invalid], "DMARC"
+        )
+        p_none = np.asarray(p, dtype=object)[invalid] == "none"
+        codes[invalid] = np.where(~dmarc_valid, 0, np.where(~spf_valid & p_none, 3, 8))
+    return codes
+
+
+def classify_frame(frame):
+    """Returns the spoofability codes of the rows of a Spoofy results DataFrame as a Series."""
+    codes = classify(
+        *(frame[column].to_numpy(dtype=object) for column in FRAME_COLUMNS)
+    )
+    return pd.Series(codes, index=frame.index, name="SPOOFABILITY")
+
+
+def master_table_inputs(path):
+    """Yields (SPF, DMARC, expected code, decide() arguments) for each row of the Master Table workbook."""
+    for row in pd.read_excel(path).itertuples(index=False):
+        spf, dmarc, expected = (str(row[0]).strip(), str(row[1]).strip(), row[2])
+        spf_record = None if spf == "No SPF" else "v=spf1"
+        spf_all = (
+            None if spf in ("No SPF", "No All") else spf.replace("all", "") + "all"
+        )
+        tags = {}
+        if dmarc != "No DMARC":
+            tags = dict(tag.strip().split("=", 1) for tag in dmarc.split(","))
+        arguments = (
+            None,
+            spf_record,
+            0,
+            spf_all,
+            tags.get("p"),
+            tags.get("sp"),
+            tags.get("aspf"),
+            None if dmarc == "No DMARC" else dmarc,
+        )
+        yield spf, dmarc, int(expected), arguments
+
+
+def main():
+    """Lists where the Master Table and the decision table differ, and times classify()."""
+    parser = argparse.ArgumentParser(
+        description="Audit and time the spoofability table."
+    )
+    parser.add_argument("--master", default="files/Master_Table.xlsx", metavar="FILE")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    differ = 0
+    for spf, dmarc, expected, arguments in master_table_inputs(args.master):
+        code = spoofability(*arguments)
+        if code != expected:
+            differ += 1
+            print(f"{spf:7} {dmarc:36} master {expected}, classifier {code}")
+    print(f"{differ} Master Table rows differ from the classifier")
+
+    combinations = list(itertools.product(*REPRESENTATIVES))
+    rows = [combinations[i % len(combinations)] for i in range(args.rows)]
+    columns = [list(column) for column in zip(*rows)]
+    started = time.perf_counter()
+    classify(*columns)
+    print(f"classify: {args.rows} rows in {time.perf_counter() - started:.2f}s")
+    sample = rows[:100000]
+    started = time.perf_counter()
+    for values in sample:
+        spoofability(*values)
+    elapsed = (time.perf_counter() - started) * args.rows / len(sample)
+    print(f"spoofability, one row at a time: about {elapsed:.2f}s for {args.rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,147 @@
 import dns.resolver
 import base64
-from cryptography.hazmat.primitives import serialization
+import json
+import os
+import threading
+from pathlib import Path
+
+from .keyinfo import key_info_cache
+from .lookup import resolve_all
+from .providers import infer_providers, provider_selectors, spf_includes
+from .tags import parse_tags
+
+DEFAULT_SELECTORS_FILE = Path(__file__).with_name("dkim_selectors.txt")
+DEFAULT_MAX_INFLIGHT = 32
+# How many of the most frequently found selectors join the provider's own
+# selectors in the first wave of probes.
+DEFAULT_FIRST_WAVE = 2
+
+
+def load_selectors(path):
+    """Returns the selectors listed in path, one per line, in order and without duplicates."""
+    selectors = []
+    with open(path, "r") as f:
+        for line in f:
+            selector = line.strip().lower()
+            if selector and not selector.startswith("#") and selector not in selectors:
+                selectors.append(selector)
+    return selectors
+
+
+class SelectorSweep:
+    """The DKIM selectors probed for every domain, most likely first.
+
+    Probes go out in two waves: the selectors of the domain's mail providers
+    plus the first_wave selectors found most often so far, then the rest of
+    the list ordered by those hit counts and then by rank. The second wave is
+    skipped once the first finds a selector, unless exhaustive is set.
+
+    max_inflight caps how many of one domain's probes are in flight at once,
+    all of which go to the same authoritative servers; the first wave fits
+    in one round trip, the full list takes a few.
+
+    A domain's order is taken on its first sweep and kept until finish(),
+    so the async engine's passes over the same domain probe the same waves
+    while other domains are learned from.
+    """
+
+    def __init__(
+        self,
+        selectors=None,
+        max_inflight=DEFAULT_MAX_INFLIGHT,
+        first_wave=DEFAULT_FIRST_WAVE,
+        exhaustive=False,
+    ):
+        if selectors is None:
+            selectors = load_selectors(DEFAULT_SELECTORS_FILE)
+        self.selectors = selectors
+        self.max_inflight = max_inflight
+        self.first_wave = first_wave
+        self.exhaustive = exhaustive
+        self.hits = {}
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def ordered(self):
+        """Returns the selectors, the most frequently found first and by rank otherwise."""
+        with self._lock:
+            hits = dict(self.hits)
+        rank = {selector: i for i, selector in enumerate(self.selectors)}
+        return sorted(self.selectors, key=lambda s: (-hits.get(s, 0), rank[s]))
+
+    def waves(self, providers=(), domain=None):
+        """Returns the lists of selectors to probe one after another, in domain's pinned order if given."""
+        with self._lock:
+            ordered = self._pinned.get(domain)
+        if ordered is None:
+            ordered = self.ordered()
+            if domain is not None:
+                with self._lock:
+                    ordered = self._pinned.setdefault(domain, ordered)
+        first = provider_selectors(providers)
+        for selector in ordered[: self.first_wave]:
+            if selector not in first:
+                first.append(selector)
+        rest = [selector for selector in ordered if selector not in first]
+        return [wave for wave in (first, rest) if wave]
+
+    def learn(self, selectors):
+        """Counts a hit for every selector found on a domain."""
+        with self._lock:
+            for selector in selectors:
+                self.hits[selector] = self.hits.get(selector, 0) + 1
+
+    def finish(self, domain, selectors, complete=True):
+        """Ends the sweep of domain, counting its selectors as hits if every probe got an answer."""
+        with self._lock:
+            self._pinned.pop(domain, None)
+        if complete:
+            self.learn(selectors)
+
+    def load_hits(self, path):
+        """Adds the hit counts saved in path, if it exists."""
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            self.add_hits(json.load(f))
+
+    def add_hits(self, hits):
+        """Adds {selector: count} hit counts, e.g. those a --processes worker found."""
+        with self._lock:
+            for selector, count in hits.items():
+                self.hits[selector] = self.hits.get(selector, 0) + int(count)
+
+    def save_hits(self, path):
+        """Writes the hit counts to path, replacing it atomically."""
+        with self._lock:
+            hits = dict(sorted(self.hits.items(), key=lambda item: -item[1]))
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(hits, f, indent=1)
+        os.replace(temp_path, path)
+
+
+selector_sweep = SelectorSweep()
 
-USUAL_SELECTORS = ["default", "google", "selector1", "mail", "spf", "dkim"]
 
 class DKIM:
-    def __init__(self, domain, dns_server=None):
+    def __init__(self, domain, dns_server=None, spf_record=None):
         self.domain = domain
         self.dns_server = dns_server
+        self.spf_record = spf_record
+        self.selector = None
+        self.selectors = []
+        self.failed_probes = 0
+        self.providers = []
         self.dkim_record = self.get_dkim_record()
+        self.tags = parse_tags(self.dkim_record)
         self.version = None
         self.algorithm = None
         self.public_key = None
         self.key_length = None
+        self.key_type = None
+        self.key_curve = None
+        self.key_fingerprint = None
 
 
         if self.dkim_record:
@@ -22,53 +151,97 @@ class DKIM:
             self.key_length = self.get_key_length()
 
     def get_dkim_record(self):
-        """Returns the DKIM record for the domain."""
+        """Returns the DKIM record of the first selector found, remembering every selector found."""
         try:
-            selector, dkim_results = self.find_dkim_selector()
-            if selector:
-                self.selector = selector
-            if dkim_results:
-                return dkim_results[0]
+            found = self.find_dkim_selectors()
         except Exception:
             return None
-        return None
+        if not found:
+            return None
+        self.selectors = [selector for selector, _ in found]
+        self.selector, dkim_results = found[0]
+        return dkim_results[0]
     
-    def find_dkim_selector(self):
-        """Finds the DKIM selector for the domain."""
-        resolver = dns.resolver.Resolver()
-        for selector in USUAL_SELECTORS:
-            query = f"{selector}._domainkey.{self.domain}"
-            try:
-                answers = resolver.resolve(query, 'TXT')
-            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer): #, dns.resolver.Timeout):
+    def find_providers(self):
+        """Checks that _domainkey.<domain> exists and infers the mail providers from MX and SPF.
+
+        Under RFC 8020 an NXDOMAIN for _domainkey means nothing exists below
+        it either, so no selector can be published and the probes are
+        skipped; an empty non-terminal answers NOERROR without data instead.
+        Returns False in that case, True otherwise.
+        """
+        nameservers = [self.dns_server] if self.dns_server else None
+        domainkey, mx = resolve_all(
+            [
+                (f"_domainkey.{self.domain}", "TXT", None),
+                (self.domain, "MX", nameservers),
+            ],
+            2,
+        )
+        if isinstance(domainkey, dns.resolver.NXDOMAIN):
+            return False
+        mx_hosts = [] if isinstance(mx, Exception) else [str(r.exchange) for r in mx]
+        self.providers = infer_providers(mx_hosts, spf_includes(self.spf_record))
+        return True
+
+    def probe(self, selectors, max_inflight):
+        """Returns [(selector, txts)] for the selectors that have a TXT record, in the given order."""
+        lookups = [
+            (f"{selector}._domainkey.{self.domain}", "TXT", None)
+            for selector in selectors
+        ]
+        found = []
+        for selector, answers in zip(selectors, resolve_all(lookups, max_inflight)):
+            if isinstance(answers, (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer)):
+                continue
+            if isinstance(answers, Exception):
+                # A timeout or a server giving up says nothing about the
+                # selector; count it so the result is marked incomplete.
+                self.failed_probes += 1
                 continue
             txts = [b"".join(rdata.strings).decode("utf-8") for rdata in answers]
-            return selector, txts
-                
+            found.append((selector, txts))
+        return found
+
+    def find_dkim_selectors(self, sweep=None):
+        """Probes the sweep's selectors wave by wave and returns [(selector, txts)] found.
+
+        Nothing is learned here, since the async engine may run this more
+        than once for a domain: the scan hands the final result to
+        sweep.finish() once the domain is done.
+        """
+        sweep = sweep or selector_sweep
+        if not self.find_providers():
+            return []
+        found = []
+        for wave in sweep.waves(self.providers, self.domain):
+            found += self.probe(wave, sweep.max_inflight)
+            if found and not sweep.exhaustive:
+                break
+        return found
+
     def get_dkim_version(self):
         """Returns the DKIM version from the DKIM record."""
-        if "v=" in self.dkim_record:
-            return self.dkim_record.split("v=")[1].split(";")[0]
-        return None
+        return self.tags.get("v")
     
     def get_dkim_algorithm(self):
         """Returns the DKIM algorithm from the DKIM record."""
-        if "k=" in self.dkim_record:
-            return self.dkim_record.split("k=")[1].split(";")[0]
-        return None
+        return self.tags.get("k")
     
     def get_dkim_public_key(self):
         """Returns the DKIM public key from the DKIM record."""
-        if "p=" in self.dkim_record:
-            return self.dkim_record.split("p=")[1].split(";")[0]
-        return None
+        return self.tags.get("p")
     
     def get_key_length(self):
-        """Returns the key size of the DKIM public key."""
+        """Returns the key size of the DKIM public key, also setting its type, curve and fingerprint."""
         try:
             der = base64.b64decode(self.public_key)
-            pub = serialization.load_der_public_key(der)
-            key_size = pub.key_size
-            return key_size
         except Exception:
-            return None
\ No newline at end of file
+            return None
+        info = key_info_cache.get(der) if der else None
+        if info is None:
+            return None
+        self.key_type = info.key_type
+        self.key_curve = info.curve
+        self.key_fingerprint = info.fingerprint
+        return info.bits
\ No newline at end of file
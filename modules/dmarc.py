@@ -1,7 +1,8 @@
 # modules/dmarc.py
 
-import dns.resolver
-import tldextract
+from .lookup import resolve
+from .psl import public_suffixes
+from .tags import parse_tags
 
 
 class DMARC:
@@ -9,6 +10,7 @@ class DMARC:
         self.domain = domain
         self.dns_server = dns_server
         self.dmarc_record = self.get_dmarc_record()
+        self.tags = parse_tags(self.dmarc_record)
         self.policy = None
         self.pct = None
         self.aspf = None
@@ -26,7 +28,7 @@ class DMARC:
 
     def get_dmarc_record(self):
         """Returns the DMARC record for the domain."""
-        subdomain = tldextract.extract(self.domain).registered_domain
+        subdomain = public_suffixes.registered_domain(self.domain)
         if subdomain != self.domain:
             return self.get_dmarc_record_for_domain(subdomain)
 
@@ -34,10 +36,8 @@ class DMARC:
 
     def get_dmarc_record_for_domain(self, domain):
         try:
-            resolver = dns.resolver.Resolver()
-            if self.dns_server:
-                resolver.nameservers = [self.dns_server]
-            dmarc = resolver.resolve(f"_dmarc.{domain}", "TXT")
+            nameservers = [self.dns_server] if self.dns_server else None
+            dmarc = resolve(f"_dmarc.{domain}", "TXT", nameservers)
         except Exception:
             return None
 
@@ -48,39 +48,29 @@ class DMARC:
 
     def get_dmarc_policy(self):
         """Returns the policy value from a DMARC record."""
-        if "p=" in str(self.dmarc_record):
-            return str(self.dmarc_record).split("p=")[1].split(";")[0]
-        return None
+        return self.tags.get("p")
 
     def get_dmarc_pct(self):
         """Returns the pct value from a DMARC record."""
-        if "pct=" in str(self.dmarc_record):
-            return str(self.dmarc_record).split("pct=")[1].split(";")[0]
-        return None
+        return self.tags.get("pct")
 
     def get_dmarc_aspf(self):
         """Returns the aspf value from a DMARC record"""
-        if "aspf=" in str(self.dmarc_record):
-            return str(self.dmarc_record).split("aspf=")[1].split(";")[0]
-        return None
+        return self.tags.get("aspf")
 
     def get_dmarc_subdomain_policy(self):
         """Returns the policy to apply for subdomains from a DMARC record."""
-        if "sp=" in str(self.dmarc_record):
-            return str(self.dmarc_record).split("sp=")[1].split(";")[0]
-        return None
+        return self.tags.get("sp")
 
     def get_dmarc_forensic_reports(self):
         """Returns the email addresses to which forensic reports should be sent."""
-        if "ruf=" in str(self.dmarc_record) and "fo=1" in str(self.dmarc_record):
-            return str(self.dmarc_record).split("ruf=")[1].split(";")[0]
+        if "1" in self.tags.get("fo", "").split(":"):
+            return self.tags.get("ruf")
         return None
 
     def get_dmarc_aggregate_reports(self):
         """Returns the email addresses to which aggregate reports should be sent."""
-        if "rua=" in str(self.dmarc_record):
-            return str(self.dmarc_record).split("rua=")[1].split(";")[0]
-        return None
+        return self.tags.get("rua")
 
     def __str__(self):
         return (
@@ -1,12 +1,57 @@
 # modules/dns.py
 
+import threading
+
 import dns.resolver
-import socket
+
+from .hedge import hedge
+from .lookup import resolve
 from .spf import SPF
 from .dmarc import DMARC
 from .bimi import BIMI
 from .dkim import DKIM
 
+PUBLIC_DNS_SERVERS = ["1.1.1.1", "8.8.8.8", "9.9.9.9"]
+
+
+class NameserverAddresses:
+    """Addresses of nameserver hosts, resolved once per scan through dnspython.
+
+    A records are preferred; AAAA is only asked for when a host has no IPv4
+    address. Lookups that fail with anything but NXDOMAIN or NoAnswer are not
+    remembered, so a timeout does not pin an empty result for the whole scan.
+    """
+
+    def __init__(self):
+        self._addresses = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """Returns the list of addresses of host, A records first."""
+        host = str(host).lower().rstrip(".")
+        with self._lock:
+            if host in self._addresses:
+                return self._addresses[host]
+
+        addresses = []
+        for rdtype in ("A", "AAAA"):
+            try:
+                addresses = [rdata.address for rdata in resolve(host, rdtype)]
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                continue
+            if addresses:
+                break
+
+        with self._lock:
+            self._addresses[host] = addresses
+        return addresses
+
+    def __len__(self):
+        return len(self._addresses)
+
+
+nameserver_addresses = NameserverAddresses()
+
 
 class DNS:
     def __init__(self, domain):
@@ -16,53 +61,60 @@ class DNS:
         self.spf_record = None
         self.dmarc_record = None
         self.bimi_record = None
+        self.dkim_record = None
 
         self.get_soa_record()
         self.get_dns_server()
+        self.dkim_record = DKIM(
+            self.domain, self.dns_server, self.spf_record.spf_record
+        )
 
     def get_soa_record(self):
         """Sets the SOA record and DNS server of a given domain."""
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = ["1.1.1.1"]
         try:
-            query = resolver.resolve(self.domain, "SOA")
+            query = resolve(self.domain, "SOA", ["1.1.1.1"])
         except Exception:
             return
         if query:
             for data in query:
                 dns_server = str(data.mname)
             try:
-                self.soa_record = socket.gethostbyname(dns_server)
+                self.soa_record = nameserver_addresses.get(dns_server)[0]
                 self.dns_server = self.soa_record
             except Exception:
                 self.soa_record = None
 
     def get_dns_server(self):
-        """Finds the DNS server that serves the domain and retrieves associated SPF, DMARC, and BIMI records."""
-        if self.soa_record:
-            self.spf_record = SPF(self.domain, self.soa_record)
-            self.dmarc_record = DMARC(self.domain, self.soa_record)
-            self.bimi_record = BIMI(self.domain, self.soa_record)
-            self.dkim_record = DKIM(self.domain, self.soa_record)
-            if self.spf_record.spf_record and self.dmarc_record.dmarc_record:
-                return
-
-        for ip_address in ["1.1.1.1", "8.8.8.8", "9.9.9.9"]:
-            self.spf_record = SPF(self.domain, ip_address)
-            self.dmarc_record = DMARC(self.domain, ip_address)
-            self.bimi_record = BIMI(self.domain, ip_address)
-            if self.spf_record.spf_record and self.dmarc_record.dmarc_record:
-                self.dns_server = ip_address
-                return
-
-        self.dns_server = "1.1.1.1"
+        """Finds the DNS server that serves the domain and keeps the SPF, DMARC, and BIMI records it returned.
+
+        The SOA server is tried first, then the public resolvers. With hedging
+        enabled a slow server is raced against the next one, and dns_server is
+        whichever answered first with both SPF and DMARC.
+        """
+        candidates = [self.soa_record] if self.soa_record else []
+        candidates += PUBLIC_DNS_SERVERS
+        dns_server, records = hedge(candidates, self.get_records)
+
+        if dns_server is None:
+            # Nobody had both SPF and DMARC: keep what the default server
+            # returned instead of asking it again.
+            dns_server = PUBLIC_DNS_SERVERS[0]
+            records = records[dns_server]
+
+        self.dns_server = dns_server
+        self.spf_record, self.dmarc_record, self.bimi_record = records
+
+    def get_records(self, dns_server):
+        """Returns whether dns_server has both SPF and DMARC, and its (SPF, DMARC, BIMI) records."""
+        spf = SPF(self.domain, dns_server)
+        dmarc = DMARC(self.domain, dns_server)
+        bimi = BIMI(self.domain, dns_server)
+        return bool(spf.spf_record and dmarc.dmarc_record), (spf, dmarc, bimi)
 
     def get_txt_record(self, record_type):
         """Returns the TXT record of a given type for the domain."""
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = [self.dns_server]
         try:
-            query = resolver.query(self.domain, record_type)
+            query = resolve(self.domain, record_type, [self.dns_server])
             return str(query[0])
         except Exception:
             return None
@@ -74,5 +126,6 @@ class DNS:
             f"DNS Server: {self.dns_server}\n"
             f"SPF Record: {self.spf_record.spf_record}\n"
             f"DMARC Record: {self.dmarc_record.dmarc_record}\n"
-            f"BIMI Record: {self.bimi_record.bimi_record}"
+            f"BIMI Record: {self.bimi_record.bimi_record}\n"
+            f"DKIM Record: {self.dkim_record.dkim_record}"
         )
@@ -0,0 +1,122 @@
+# modules/engine.py
+
+import asyncio
+import contextlib
+import time
+
+from .cache import answer_cache
+from .lookup import (
+    PendingLookups,
+    PrefetchedAnswers,
+    fetch_async,
+    prefetched_answers,
+)
+from .udp import UDPMultiplexer
+
+DEFAULT_MAX_INFLIGHT = 1000
+
+
+class AsyncScanner:
+    """Runs a synchronous process_domain for many domains at once on asyncio.
+
+    Each pass of process_domain only sees answers that were already fetched.
+    The first lookup it is missing stops the pass with PendingLookups; the
+    scanner fetches it as a coroutine, letting other domains run meanwhile,
+    and starts the pass again. The last pass is a plain run of the same code
+    the threaded workers use, so both paths produce the same results.
+
+    With multiplex=True queries go through a UDPMultiplexer instead of a
+    socket per query.
+    """
+
+    def __init__(
+        self, process_domain, max_inflight=DEFAULT_MAX_INFLIGHT, multiplex=False
+    ):
+        self.process_domain = process_domain
+        self.max_inflight = max_inflight
+        self.multiplex = multiplex
+        self.multiplexer = None
+        self.durations = []
+        self._limit = None
+        self._inflight = {}
+
+    async def fetch(self, qname, rdtype, nameservers):
+        """Fetches a lookup, sharing the query with every domain waiting on the same one."""
+        key = answer_cache.make_key(qname, rdtype, nameservers)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                fetch_async(qname, rdtype, nameservers, self._limit)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            return key, await task, 1
+        return key, await task, 0
+
+    async def scan_domain(self, domain):
+        """Returns the process_domain result for domain once all its lookups are fetched."""
+        answers = PrefetchedAnswers()
+        fetching = {}
+        queries = 0
+        started = time.monotonic()
+        while True:
+            try:
+                with prefetched_answers(answers):
+                    result = self.process_domain(domain)
+                break
+            except PendingLookups as pending:
+                waiting = set()
+                for lookup in pending.lookups:
+                    key = answer_cache.make_key(*lookup)
+                    if key not in fetching:
+                        fetching[key] = asyncio.ensure_future(self.fetch(*lookup))
+                    waiting.add(fetching[key])
+                done, _ = await asyncio.wait(
+                    waiting,
+                    timeout=pending.timeout,
+                    return_when=(
+                        asyncio.FIRST_COMPLETED
+                        if pending.wait_any
+                        else asyncio.ALL_COMPLETED
+                    ),
+                )
+            for task in done:
+                key, answer, sent = task.result()
+                if key not in answers:
+                    answers[key] = answer
+                    queries += sent
+
+        result["DNS_QUERIES"] = queries
+        self.durations.append(time.monotonic() - started)
+        return result
+
+    async def _worker(self, domains, handle_result):
+        for domain in domains:
+            handle_result(await self.scan_domain(domain))
+
+    async def run(self, domains, handle_result):
+        """Scans every domain, passing each result to handle_result as it completes."""
+        self._limit = asyncio.Semaphore(self.max_inflight)
+        domains = iter(domains)
+        if self.multiplex:
+            self.multiplexer = UDPMultiplexer()
+        with self.multiplexer or contextlib.nullcontext():
+            await asyncio.gather(
+                *(
+                    self._worker(domains, handle_result)
+                    for _ in range(self.max_inflight)
+                )
+            )
+
+
+def run_async(
+    domains,
+    process_domain,
+    handle_result,
+    max_inflight=DEFAULT_MAX_INFLIGHT,
+    multiplex=False,
+):
+    """Scans domains with an AsyncScanner on a new event loop and returns the time each domain took."""
+    scanner = AsyncScanner(process_domain, max_inflight, multiplex)
+    asyncio.run(scanner.run(domains, handle_result))
+    return scanner.durations
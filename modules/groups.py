@@ -0,0 +1,67 @@
+# modules/groups.py
+
+import threading
+
+from .psl import public_suffixes
+
+
+def group_by_org(domains):
+    """Returns {organizational domain: [domains]} with both in input order."""
+    groups = {}
+    for domain in domains:
+        org = public_suffixes.registered_domain(domain) or domain
+        groups.setdefault(org, []).append(domain)
+    return groups
+
+
+def schedule(groups):
+    """Returns the domains of groups in scan order, one host per organization at a time.
+
+    Every organization's first host comes first, the organizational domain
+    itself when it was given; then every organization's second host, and
+    so on. Hosts of one organization are spread apart, so its DMARC record
+    is usually cached by the time the next host looks it up, without a
+    barrier that would hold the scan up for the slowest organization.
+    """
+    ranked = []
+    for org, members in groups.items():
+        leader = org if org in members else members[0]
+        rest = list(members)
+        rest.remove(leader)
+        ranked.append([leader] + rest)
+    order = []
+    for rank in range(max(map(len, ranked), default=0)):
+        order += [members[rank] for members in ranked if rank < len(members)]
+    return order
+
+
+class OrgLookups:
+    """Counts the lookups of organizations' DMARC records (_dmarc.<org>) that went out.
+
+    Set as answer_cache.observer while scanning with --group-by-org. A
+    lookup sent more than once was asked for again before its first answer
+    was in: these repeats are what grouping tries to avoid.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self._keys = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        qname = key[0]
+        if not qname.startswith("_dmarc."):
+            return
+        org = qname[len("_dmarc.") :]
+        if public_suffixes.registered_domain(org) == org:
+            with self._lock:
+                self.sent += 1
+                self._keys.add(key)
+
+    def stats(self):
+        """Returns how many organization DMARC lookups went out, and how many were distinct."""
+        with self._lock:
+            return {"sent": self.sent, "distinct": len(self._keys)}
+
+
+org_lookups = OrgLookups()
@@ -0,0 +1,180 @@
+# modules/hedge.py
+
+import concurrent.futures
+import contextvars
+import threading
+import time
+from collections import deque
+
+from .lookup import PendingLookups, current_answers
+
+DEFAULT_INITIAL_DELAY = 1.0
+MIN_DELAY = 0.05
+MIN_SAMPLES = 20
+MAX_SAMPLES = 1000
+HEDGE_WORKERS = 64
+
+
+class LatencyTracker:
+    """Keeps the most recent durations and turns them into a hedge delay.
+
+    percentile=None disables hedging: candidates are then tried strictly one
+    after another, as get_dns_server always did.
+    """
+
+    def __init__(self, percentile=None, initial_delay=DEFAULT_INITIAL_DELAY):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.wins = {}
+        self._samples = deque(maxlen=MAX_SAMPLES)
+        self._lock = threading.Lock()
+
+    def add(self, duration):
+        with self._lock:
+            self._samples.append(duration)
+
+    def record_win(self, position):
+        """Counts which position in the candidate list produced the answer."""
+        with self._lock:
+            self.wins[position] = self.wins.get(position, 0) + 1
+
+    def delay(self):
+        """Returns how long to wait for a candidate before starting the next one, or None."""
+        if self.percentile is None:
+            return None
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return self.initial_delay
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(ordered[index], MIN_DELAY)
+
+    def stats(self):
+        """Returns the number of samples, the current delay and the wins per position."""
+        with self._lock:
+            samples = len(self._samples)
+            wins = dict(self.wins)
+        return {"samples": samples, "delay": self.delay(), "wins": wins}
+
+
+discovery_latency = LatencyTracker()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                HEDGE_WORKERS, thread_name_prefix="hedge"
+            )
+        return _executor
+
+
+def hedge(candidates, evaluate, tracker=discovery_latency):
+    """Evaluates candidates in order, hedging slow ones with the next candidate.
+
+    evaluate(candidate) returns (valid, result). The next candidate starts as
+    soon as the previous one comes back invalid, or once it has been running
+    longer than tracker.delay(). Returns (candidate, result) for the first valid
+    result, or (None, {candidate: result}) when none of them was valid.
+    """
+    if current_answers() is not None:
+        return _hedge_prefetched(candidates, evaluate, tracker)
+    delay = tracker.delay()
+    if delay is None:
+        return _hedge_sequential(candidates, evaluate, tracker)
+    return _hedge_threads(candidates, evaluate, tracker, delay)
+
+
+def _hedge_sequential(candidates, evaluate, tracker):
+    invalid = {}
+    for position, candidate in enumerate(candidates):
+        valid, result = evaluate(candidate)
+        if valid:
+            tracker.record_win(position)
+            return candidate, result
+        invalid[candidate] = result
+    return None, invalid
+
+
+def _hedge_threads(candidates, evaluate, tracker, delay):
+    executor = _get_executor()
+    running = {}
+    invalid = {}
+
+    def start(position):
+        context = contextvars.copy_context()
+        future = executor.submit(context.run, evaluate, candidates[position])
+        running[future] = (position, time.monotonic())
+
+    start(0)
+    next_position = 1
+    while running:
+        timeout = delay if next_position < len(candidates) else None
+        done, _ = concurrent.futures.wait(
+            running, timeout, concurrent.futures.FIRST_COMPLETED
+        )
+        for future in sorted(done, key=lambda f: running[f][0]):
+            position, started = running.pop(future)
+            valid, result = future.result()
+            tracker.add(time.monotonic() - started)
+            if valid:
+                tracker.record_win(position)
+                # Losers still queued never start; running ones are not waited for.
+                for loser in running:
+                    loser.cancel()
+                return candidates[position], result
+            invalid[candidates[position]] = result
+        # Either the wait timed out or everything that finished was invalid.
+        if next_position < len(candidates):
+            start(next_position)
+            next_position += 1
+    return None, invalid
+
+
+def _hedge_prefetched(candidates, evaluate, tracker):
+    """Runs the hedge inside a pass of the async engine.
+
+    Start times are kept with the domain's answers so they survive reruns.
+    Lookups missing for every running candidate are raised together; the
+    engine resumes as soon as any of them is answered or the next hedge is due.
+    """
+    answers = current_answers()
+    state = answers.hedges.setdefault(
+        tuple(candidates), {"starts": {0: time.monotonic()}, "recorded": False}
+    )
+    starts = state["starts"]
+    delay = tracker.delay()
+    now = time.monotonic()
+    pending = []
+    invalid = {}
+    wake_up = None
+
+    for position, candidate in enumerate(candidates):
+        if position not in starts:
+            previous_done = candidates[position - 1] in invalid
+            due = delay is not None and now >= starts[position - 1] + delay
+            if not (previous_done or due):
+                if delay is not None:
+                    wake_up = starts[position - 1] + delay - now
+                break
+            starts[position] = now
+        try:
+            valid, result = evaluate(candidate)
+        except PendingLookups as missing:
+            pending.extend(missing.lookups)
+            continue
+        if valid:
+            # Later passes of the same domain return here again; count it once.
+            if not state["recorded"]:
+                tracker.add(now - starts[position])
+                tracker.record_win(position)
+                state["recorded"] = True
+            return candidate, result
+        invalid[candidate] = result
+
+    if pending:
+        raise PendingLookups(pending, wait_any=True, timeout=wake_up)
+    return None, invalid
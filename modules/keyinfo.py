@@ -0,0 +1,175 @@
+# modules/keyinfo.py
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10000
+
+RSA_OID = "1.2.840.113549.1.1.1"
+EC_OID = "1.2.840.10045.2.1"
+ED25519_OID = "1.3.101.112"
+ED448_OID = "1.3.101.113"
+CURVES = {
+    "1.2.840.10045.3.1.7": ("secp256r1", 256),
+    "1.3.132.0.34": ("secp384r1", 384),
+    "1.3.132.0.35": ("secp521r1", 521),
+}
+
+
+class KeyInfo:
+    """What a DKIM p= value says about its key: type, bit length, curve and SHA-256 fingerprint."""
+
+    def __init__(self, key_type, bits, curve=None, fingerprint=None):
+        self.key_type = key_type
+        self.bits = bits
+        self.curve = curve
+        self.fingerprint = fingerprint
+
+    def __eq__(self, other):
+        return isinstance(other, KeyInfo) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"KeyInfo({self.key_type!r}, {self.bits!r}, {self.curve!r})"
+
+
+def _read(data, offset, tag):
+    """Reads the DER element with tag at offset and returns (start, end) of its contents."""
+    if data[offset] != tag:
+        raise ValueError(f"expected tag {tag:#x} at {offset}")
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        if not 0 < size <= 4:
+            raise ValueError("unsupported length")
+        length = int.from_bytes(data[offset : offset + size], "big")
+        offset += size
+    end = offset + length
+    if end > len(data):
+        raise ValueError("truncated element")
+    return offset, end
+
+
+def _oid(data):
+    first, rest = divmod(data[0], 40) if data[0] < 80 else (2, data[0] - 80)
+    parts = [first, rest]
+    value = 0
+    for byte in data[1:]:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            parts.append(value)
+            value = 0
+    return ".".join(map(str, parts))
+
+
+def parse_spki(der):
+    """Returns (key_type, bits, curve) from a DER SubjectPublicKeyInfo, raising ValueError otherwise."""
+    start, end = _read(der, 0, 0x30)
+    if end != len(der):
+        raise ValueError("trailing data")
+    algorithm_start, algorithm_end = _read(der, start, 0x30)
+    oid_start, oid_end = _read(der, algorithm_start, 0x06)
+    algorithm = _oid(der[oid_start:oid_end])
+    key_start, key_end = _read(der, algorithm_end, 0x03)
+    if der[key_start] != 0:
+        raise ValueError("unused bits in key")
+    key_start += 1
+
+    if algorithm == RSA_OID:
+        sequence_start, _ = _read(der, key_start, 0x30)
+        modulus_start, modulus_end = _read(der, sequence_start, 0x02)
+        modulus = der[modulus_start:modulus_end].lstrip(b"\0")
+        if not modulus:
+            raise ValueError("empty modulus")
+        return "rsa", (len(modulus) - 1) * 8 + modulus[0].bit_length(), None
+    if algorithm == ED25519_OID and key_end - key_start == 32:
+        return "ed25519", 256, None
+    if algorithm == ED448_OID and key_end - key_start == 57:
+        return "ed448", 456, None
+    if algorithm == EC_OID and oid_end < algorithm_end:
+        curve_start, curve_end = _read(der, oid_end, 0x06)
+        curve = CURVES.get(_oid(der[curve_start:curve_end]))
+        if curve:
+            return "ec", curve[1], curve[0]
+    raise ValueError(f"unsupported key algorithm {algorithm}")
+
+
+def _parse_with_cryptography(der):
+    """Parses keys the DER walk does not know, such as PKCS#1 RSA keys or other curves.
+
+    Raises ValueError for keys it cannot read, including when cryptography
+    is not installed or does not support the key's algorithm.
+    """
+    try:
+        from cryptography.exceptions import UnsupportedAlgorithm
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, rsa
+    except ImportError as error:
+        raise ValueError("cryptography is not installed") from error
+
+    try:
+        key = serialization.load_der_public_key(der)
+    except UnsupportedAlgorithm as error:
+        raise ValueError(str(error)) from error
+    if isinstance(key, rsa.RSAPublicKey):
+        return "rsa", key.key_size, None
+    if isinstance(key, ec.EllipticCurvePublicKey):
+        return "ec", key.key_size, key.curve.name
+    if isinstance(key, ed25519.Ed25519PublicKey):
+        return "ed25519", 256, None
+    if isinstance(key, ed448.Ed448PublicKey):
+        return "ed448", 456, None
+    raise ValueError(f"unsupported key {type(key).__name__}")
+
+
+class KeyInfoCache:
+    """Parsed keys by SHA-256 fingerprint, so a provider's key shared by many domains is parsed once.
+
+    Keys are read with a small DER walk; cryptography is only imported for
+    the rare keys it does not handle.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, der):
+        """Returns the KeyInfo of a DER public key, or None if it cannot be parsed."""
+        fingerprint = hashlib.sha256(der).hexdigest()
+        with self._lock:
+            info = self._entries.get(fingerprint)
+            if info is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return info
+            self.misses += 1
+
+        info = self.parse(der, fingerprint)
+        if info is None:
+            return None
+        with self._lock:
+            self._entries[fingerprint] = info
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return info
+
+    @staticmethod
+    def parse(der, fingerprint):
+        # RFC 8463 Ed25519 DKIM keys are the bare 32 key bytes, not an SPKI.
+        if len(der) == 32:
+            return KeyInfo("ed25519", 256, None, fingerprint)
+        try:
+            return KeyInfo(*parse_spki(der), fingerprint=fingerprint)
+        except (ValueError, IndexError):
+            pass
+        try:
+            return KeyInfo(*_parse_with_cryptography(der), fingerprint=fingerprint)
+        except (ValueError, TypeError):
+            return None
+
+
+key_info_cache = KeyInfoCache()
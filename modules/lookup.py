@@ -0,0 +1,239 @@
+# modules/lookup.py
+
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+
+import dns.exception
+import dns.resolver
+
+from .cache import answer_cache, negative_ttl
+from .pool import resolver_pool
+from .recording import dns_recording
+
+# Threads used by resolve_all() outside the async engine, shared by all domains.
+RESOLVE_ALL_WORKERS = 256
+# What a failed lookup raises; anything else is a bug and propagates.
+LOOKUP_ERRORS = (dns.exception.DNSException, OSError)
+
+_query_counter = contextvars.ContextVar("query_counter", default=None)
+_prefetched = contextvars.ContextVar("prefetched_answers", default=None)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class QueryCounter:
+    """Counts the lookups made, and the queries actually sent, while it is active."""
+
+    def __init__(self):
+        self.lookups = 0
+        self.queries = 0
+        self._token = None
+        self._lock = threading.Lock()
+
+    def add(self, lookups=0, queries=0):
+        # resolve_all() and hedging count from several threads at once.
+        with self._lock:
+            self.lookups += lookups
+            self.queries += queries
+
+    def __enter__(self):
+        self._token = _query_counter.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _query_counter.reset(self._token)
+
+
+class PendingLookups(BaseException):
+    """Raised by resolve() under prefetched_answers() when an answer has not been fetched yet.
+
+    It derives from BaseException so the modules' `except Exception` handlers
+    do not mistake it for a failed lookup. With wait_any the pass can go on as
+    soon as any of the lookups is answered, or after timeout seconds.
+    """
+
+    def __init__(self, lookups, wait_any=False, timeout=None):
+        super().__init__(lookups)
+        self.lookups = lookups
+        self.wait_any = wait_any
+        self.timeout = timeout
+
+
+class PrefetchedAnswers(dict):
+    """The answers fetched so far for one domain, keyed like the answer cache.
+
+    pending holds the keys that missed the cache and are being fetched, so
+    later passes do not look them up (and count a miss) again. hedges keeps
+    the state of modules.hedge groups between passes.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.pending = set()
+        self.hedges = {}
+
+
+@contextlib.contextmanager
+def prefetched_answers(answers):
+    """Makes resolve() answer only from answers (and the shared cache) in this context."""
+    token = _prefetched.set(answers)
+    try:
+        yield answers
+    finally:
+        _prefetched.reset(token)
+
+
+def current_answers():
+    """Returns the PrefetchedAnswers of the running pass, or None outside the async engine."""
+    return _prefetched.get()
+
+
+def _answer(value):
+    """Returns a cached RRset, or raises the exception type stored in its place."""
+    if isinstance(value, type):
+        raise value()
+    return value
+
+
+def _store(key, value, ttl):
+    answer_cache.put(key, value, ttl)
+    dns_recording.save(key, value, ttl)
+
+
+def resolve(qname, rdtype, nameservers=None):
+    """Returns the RRset answering qname/rdtype, going through the shared answer cache.
+
+    nameservers=None uses the system resolver configuration. NXDOMAIN and
+    NoAnswer are cached and re-raised like the uncached resolver would. Lookups
+    that reach the network are written to, or answered from, dns_recording.
+    """
+    counter = _query_counter.get()
+    if counter:
+        counter.add(lookups=1)
+
+    key = answer_cache.make_key(qname, rdtype, nameservers)
+    answers = _prefetched.get()
+    if answers is not None:
+        if key in answers:
+            return _answer(answers[key])
+        if key in answers.pending:
+            raise PendingLookups([(qname, rdtype, nameservers)])
+
+    cached = answer_cache.get(key)
+    if cached is not None:
+        if answers is not None:
+            answers[key] = cached
+        return _answer(cached)
+
+    if answers is not None:
+        answers.pending.add(key)
+        raise PendingLookups([(qname, rdtype, nameservers)])
+
+    if counter:
+        counter.add(queries=1)
+
+    if dns_recording.replaying:
+        value, ttl = dns_recording.lookup(key)
+        answer_cache.put(key, value, ttl)
+        return _answer(value)
+
+    try:
+        answer = resolver_pool.get(nameservers).resolve(qname, rdtype)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+        _store(key, type(e), negative_ttl(e))
+        raise
+    except LOOKUP_ERRORS as e:
+        dns_recording.save(key, type(e), 0)
+        raise
+
+    _store(key, answer.rrset, answer.rrset.ttl)
+    return answer.rrset
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                RESOLVE_ALL_WORKERS, thread_name_prefix="resolve"
+            )
+        return _executor
+
+
+def _resolve_or_error(qname, rdtype, nameservers):
+    try:
+        return resolve(qname, rdtype, nameservers)
+    except LOOKUP_ERRORS as e:
+        return e
+
+
+def resolve_all(lookups, max_inflight):
+    """Resolves (qname, rdtype, nameservers) lookups concurrently, at most max_inflight at a time.
+
+    Returns a list in the order of lookups holding each RRset, or the
+    exception resolve() raised for it. Inside the async engine the missing
+    lookups are handed to it max_inflight at a time; otherwise they run on a
+    shared thread pool.
+    """
+    if current_answers() is not None:
+        results = []
+        missing = []
+        for lookup in lookups:
+            try:
+                results.append(_resolve_or_error(*lookup))
+            except PendingLookups as pending:
+                missing.extend(pending.lookups)
+        if missing:
+            raise PendingLookups(missing[:max_inflight])
+        return results
+
+    if max_inflight <= 1 or len(lookups) <= 1:
+        return [_resolve_or_error(*lookup) for lookup in lookups]
+
+    executor = _get_executor()
+    results = [None] * len(lookups)
+    running = {}
+    queued = iter(enumerate(lookups))
+    while True:
+        for index, lookup in queued:
+            context = contextvars.copy_context()
+            future = executor.submit(context.run, _resolve_or_error, *lookup)
+            running[future] = index
+            if len(running) >= max_inflight:
+                break
+        if not running:
+            return results
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            results[running.pop(future)] = future.result()
+
+
+async def fetch_async(qname, rdtype, nameservers, limit):
+    """Sends one lookup from the event loop and stores the answer in the shared cache.
+
+    Returns the RRset, or the exception type that resolve() should raise for it.
+    limit is the semaphore bounding the number of queries in flight.
+    """
+    key = answer_cache.make_key(qname, rdtype, nameservers)
+    if dns_recording.replaying:
+        value, ttl = dns_recording.lookup(key)
+        answer_cache.put(key, value, ttl)
+        return value
+
+    async with limit:
+        try:
+            resolver = resolver_pool.get_async(nameservers)
+            answer = await resolver.resolve_async(qname, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+            _store(key, type(e), negative_ttl(e))
+            return type(e)
+        except LOOKUP_ERRORS as e:
+            dns_recording.save(key, type(e), 0)
+            return type(e)
+
+    _store(key, answer.rrset, answer.rrset.ttl)
+    return answer.rrset
@@ -0,0 +1,144 @@
+# modules/networks.py
+
+import bisect
+import ipaddress
+import threading
+
+WIDTHS = {4: 32, 6: 128}
+
+
+class NetworkSet:
+    """An immutable set of IP networks, kept as sorted, merged integer ranges per address family."""
+
+    def __init__(self, networks=(), ranges=None):
+        if ranges is None:
+            ranges = {4: [], 6: []}
+            for network in networks:
+                network = ipaddress.ip_network(network, strict=False)
+                first = int(network.network_address)
+                ranges[network.version].append(
+                    (first, first + network.num_addresses - 1)
+                )
+        self._ranges = {version: _merge(ranges[version]) for version in WIDTHS}
+        self._starts = {
+            version: [start for start, _ in self._ranges[version]] for version in WIDTHS
+        }
+
+    @classmethod
+    def union(cls, sets):
+        """Returns the NetworkSet covering every address of sets."""
+        ranges = {4: [], 6: []}
+        for network_set in sets:
+            for version in WIDTHS:
+                ranges[version] += network_set._ranges[version]
+        return cls(ranges=ranges)
+
+    def __contains__(self, prefix):
+        """Returns whether every address of an IP address or network is in the set."""
+        network = ipaddress.ip_network(prefix, strict=False)
+        first = int(network.network_address)
+        last = first + network.num_addresses - 1
+        index = bisect.bisect_right(self._starts[network.version], first) - 1
+        return index >= 0 and self._ranges[network.version][index][1] >= last
+
+    def __bool__(self):
+        return bool(self._ranges[4] or self._ranges[6])
+
+    def __eq__(self, other):
+        return isinstance(other, NetworkSet) and self._ranges == other._ranges
+
+    def num_addresses(self, version=4):
+        """Returns how many addresses of the address family the set covers."""
+        return sum(last - first + 1 for first, last in self._ranges[version])
+
+    def networks(self):
+        """Yields the fewest CIDR networks that cover the set, IPv4 first."""
+        for version, address in (
+            (4, ipaddress.IPv4Address),
+            (6, ipaddress.IPv6Address),
+        ):
+            for first, last in self._ranges[version]:
+                yield from ipaddress.summarize_address_range(
+                    address(first), address(last)
+                )
+
+    def __repr__(self):
+        return f"NetworkSet({[str(network) for network in self.networks()]!r})"
+
+
+def _merge(ranges):
+    """Returns ranges sorted, with overlapping and adjacent ranges joined."""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+class NetworkIndex:
+    """Which scanned domains authorize an address, as a binary radix trie per address family.
+
+    Each node is [zero child, one child, domains]; a domain is stored at the
+    node of every CIDR its SPF record authorizes, so a lookup only walks the
+    bits of the queried prefix. Set enabled before the scan to flatten SPF
+    records into it. While journal is a list, every add() is also appended
+    to it, for a --processes worker to hand back to the main process.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.journal = None
+        self.domains = set()
+        self._roots = {version: [None, None, None] for version in WIDTHS}
+        self._lock = threading.Lock()
+
+    def add(self, domain, network_set):
+        """Records that domain authorizes every address of network_set."""
+        with self._lock:
+            if self.journal is not None:
+                self.journal.append((domain, network_set))
+            self.domains.add(domain)
+            for network in network_set.networks():
+                width = WIDTHS[network.version]
+                value = int(network.network_address)
+                node = self._roots[network.version]
+                for depth in range(network.prefixlen):
+                    bit = (value >> (width - 1 - depth)) & 1
+                    if node[bit] is None:
+                        node[bit] = [None, None, None]
+                    node = node[bit]
+                if node[2] is None:
+                    node[2] = set()
+                node[2].add(domain)
+
+    def drain(self):
+        """Returns and clears the journal of add() calls."""
+        with self._lock:
+            journal = self.journal or []
+            if self.journal is not None:
+                self.journal = []
+        return journal
+
+    def lookup(self, prefix):
+        """Returns the sorted domains whose SPF authorizes every address of an IP address or network."""
+        network = ipaddress.ip_network(prefix, strict=False)
+        width = WIDTHS[network.version]
+        value = int(network.network_address)
+        found = set()
+        with self._lock:
+            node = self._roots[network.version]
+            for depth in range(network.prefixlen + 1):
+                if node[2]:
+                    found |= node[2]
+                if depth == network.prefixlen:
+                    break
+                node = node[(value >> (width - 1 - depth)) & 1]
+                if node is None:
+                    break
+        return sorted(found)
+
+
+spf_networks = NetworkIndex()
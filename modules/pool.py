@@ -0,0 +1,289 @@
+# modules/pool.py
+
+import asyncio
+import socket
+import threading
+import time
+
+import dns.asyncquery
+import dns.exception
+import dns.flags
+import dns.inet
+import dns.message
+import dns.name
+import dns.query
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+from .throttle import throttle
+from .udp import current_multiplexer
+
+# Rotate each socket after this many queries so a scan does not sit on one
+# source port for its whole run.
+SOCKET_MAX_QUERIES = 1000
+
+
+class SocketPool:
+    """One nonblocking UDP socket per address family, reused across queries."""
+
+    def __init__(self, max_queries=SOCKET_MAX_QUERIES):
+        self.max_queries = max_queries
+        self._sockets = {}
+
+    def get(self, af):
+        """Returns the socket for the address family, opening a fresh one when needed."""
+        sock, uses = self._sockets.get(af, (None, 0))
+        if sock is None or uses >= self.max_queries:
+            self.discard(af)
+            sock = socket.socket(af, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            uses = 0
+        self._sockets[af] = (sock, uses + 1)
+        return sock
+
+    def discard(self, af):
+        """Closes the socket for the address family, e.g. after a socket error."""
+        sock, _ = self._sockets.pop(af, (None, 0))
+        if sock is not None:
+            sock.close()
+
+
+class _Resolution:
+    """The state of one lookup across the nameservers of a PooledResolver.
+
+    Servers are tried round-robin. A timeout puts the server back in the
+    rotation, REFUSED and SERVFAIL do so up to throttle.retries times, and any
+    other error drops it. Timeouts, REFUSED and SERVFAIL also make the
+    throttle back off that server.
+    """
+
+    def __init__(self, resolver, qname, rdtype):
+        self.qname = dns.name.from_text(str(qname))
+        self.rdtype = dns.rdatatype.RdataType.make(rdtype)
+        self.request = dns.message.make_query(self.qname, self.rdtype)
+        self.start = time.monotonic()
+        self.deadline = self.start + resolver.lifetime
+        self.timeout = resolver.timeout
+        self.servers = list(zip(resolver.nameservers, resolver.families))
+        self.retries = {}
+        self.errors = []
+        self.sent = 0
+
+    def next_attempt(self):
+        """Returns (server, timeout, delay) for the next send, raising once out of servers or time.
+
+        The wait the throttle asks for is cut short so the send still gets
+        a full timeout within the lifetime; only a lookup that has already
+        been sent can run out of time.
+        """
+        if not self.servers:
+            throttle.record_failure()
+            raise dns.resolver.NoNameservers(request=self.request, errors=self.errors)
+        server = self.servers.pop(0)
+        delay = throttle.reserve(server[0])
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0 and self.sent:
+            throttle.record_failure()
+            raise dns.resolver.LifetimeTimeout(
+                timeout=time.monotonic() - self.start, errors=self.errors
+            )
+        delay = min(delay, max(remaining - self.timeout, 0))
+        self.sent += 1
+        return server, min(self.timeout, remaining - delay), delay
+
+    def timed_out(self, server, error):
+        self.errors.append((server[0], False, 53, error, None))
+        throttle.penalize(server[0])
+        self.servers.append(server)
+
+    def failed(self, server, error):
+        self.errors.append((server[0], False, 53, error, None))
+
+    def answer(self, server, response):
+        """Returns the Answer in response, raises NXDOMAIN/NoAnswer, or returns None to keep going."""
+        nameserver = server[0]
+        rcode = response.rcode()
+        if rcode == dns.rcode.NXDOMAIN:
+            throttle.reward(nameserver)
+            raise dns.resolver.NXDOMAIN(
+                qnames=[self.qname], responses={self.qname: response}
+            )
+        if rcode == dns.rcode.NOERROR:
+            throttle.reward(nameserver)
+            answer = dns.resolver.Answer(
+                self.qname, self.rdtype, dns.rdataclass.IN, response, nameserver, 53
+            )
+            if answer.rrset is None:
+                raise dns.resolver.NoAnswer(response=response)
+            return answer
+
+        self.errors.append((nameserver, False, 53, dns.rcode.to_text(rcode), response))
+        if rcode in (dns.rcode.REFUSED, dns.rcode.SERVFAIL):
+            throttle.penalize(nameserver)
+            if self.retries.get(nameserver, 0) < throttle.retries:
+                self.retries[nameserver] = self.retries.get(nameserver, 0) + 1
+                self.servers.append(server)
+        return None
+
+
+class PooledResolver:
+    """Resolves against a fixed nameserver list, on a thread's reusable UDP sockets or on asyncio.
+
+    It follows dns.resolver.Resolver: timeouts are retried until the lifetime
+    runs out, truncated answers are retried over TCP, and errors surface as
+    the same dns.resolver exceptions. Every send goes through the
+    per-nameserver limits of modules.throttle.
+
+    redirect=(address, port) sends the queries for every nameserver to that
+    one server instead, e.g. a modules.synthetic server in a load test.
+    """
+
+    def __init__(self, nameservers, sockets, timeout, lifetime, redirect=None):
+        self.redirect = redirect
+        if redirect:
+            self.families = [dns.inet.af_for_address(redirect[0])] * len(nameservers)
+        else:
+            self.families = [dns.inet.af_for_address(ns) for ns in nameservers]
+        self.nameservers = list(nameservers)
+        self.sockets = sockets
+        self.timeout = timeout
+        self.lifetime = lifetime
+
+    def destination(self, nameserver):
+        """Returns the (address, port) queries meant for nameserver are sent to."""
+        return self.redirect or (nameserver, 53)
+
+    def query(self, request, nameserver, af, timeout):
+        """Sends request to one nameserver, falling back to TCP if the answer is truncated."""
+        where, port = self.destination(nameserver)
+        try:
+            response = dns.query.udp(
+                request,
+                where,
+                timeout,
+                port,
+                sock=self.sockets.get(af),
+                ignore_unexpected=True,
+                ignore_errors=True,
+            )
+        except OSError:
+            self.sockets.discard(af)
+            raise
+        if response.flags & dns.flags.TC:
+            response = dns.query.tcp(request, where, timeout, port)
+        return response
+
+    async def query_async(self, request, nameserver, af, timeout):
+        """Sends request to one nameserver from the event loop, falling back to TCP if truncated."""
+        where, port = self.destination(nameserver)
+        multiplexer = current_multiplexer()
+        if multiplexer:
+            return await multiplexer.query(request, where, timeout, port)
+        response = await dns.asyncquery.udp(
+            request, where, timeout, port, ignore_unexpected=True, ignore_errors=True
+        )
+        if response.flags & dns.flags.TC:
+            response = await dns.asyncquery.tcp(request, where, timeout, port)
+        return response
+
+    def resolve(self, qname, rdtype):
+        """Returns the dns.resolver.Answer for qname/rdtype, raising like Resolver.resolve."""
+        resolution = _Resolution(self, qname, rdtype)
+        while True:
+            server, timeout, delay = resolution.next_attempt()
+            if delay > 0:
+                time.sleep(delay)
+            with throttle.inflight(server[0]):
+                try:
+                    response = self.query(resolution.request, *server, timeout)
+                except dns.exception.Timeout as e:
+                    resolution.timed_out(server, e)
+                    continue
+                except (dns.exception.DNSException, OSError, EOFError) as e:
+                    resolution.failed(server, e)
+                    continue
+            answer = resolution.answer(server, response)
+            if answer:
+                return answer
+
+    async def resolve_async(self, qname, rdtype):
+        """Coroutine version of resolve()."""
+        resolution = _Resolution(self, qname, rdtype)
+        while True:
+            server, timeout, delay = resolution.next_attempt()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with throttle.inflight_async(server[0]):
+                try:
+                    response = await self.query_async(
+                        resolution.request, *server, timeout
+                    )
+                except dns.exception.Timeout as e:
+                    resolution.timed_out(server, e)
+                    continue
+                except (dns.exception.DNSException, OSError, EOFError) as e:
+                    resolution.failed(server, e)
+                    continue
+            answer = resolution.answer(server, response)
+            if answer:
+                return answer
+
+
+class ResolverPool:
+    """Per-thread resolvers keyed by nameserver list, configured once and sharing sockets.
+
+    nameservers=None stands for the system configuration, which is read from
+    /etc/resolv.conf only the first time it is needed. Set redirect before
+    the first lookup to send every query to one (address, port).
+    """
+
+    def __init__(self):
+        self.redirect = None
+        self._local = threading.local()
+        self._default = None
+        self._async_resolvers = {}
+
+    @property
+    def default(self):
+        if self._default is None:
+            self._default = dns.resolver.get_default_resolver()
+        return self._default
+
+    def get(self, nameservers=None):
+        """Returns the calling thread's PooledResolver for nameservers."""
+        key = tuple(nameservers) if nameservers else None
+        resolvers = getattr(self._local, "resolvers", None)
+        if resolvers is None:
+            resolvers = self._local.resolvers = {}
+            self._local.sockets = SocketPool()
+        resolver = resolvers.get(key)
+        if resolver is None:
+            resolver = PooledResolver(
+                nameservers or self.default.nameservers,
+                self._local.sockets,
+                self.default.timeout,
+                self.default.lifetime,
+                self.redirect,
+            )
+            resolvers[key] = resolver
+        return resolver
+
+    def get_async(self, nameservers=None):
+        """Returns the PooledResolver used from the event loop for nameservers."""
+        key = tuple(nameservers) if nameservers else None
+        resolver = self._async_resolvers.get(key)
+        if resolver is None:
+            resolver = PooledResolver(
+                nameservers or self.default.nameservers,
+                None,
+                self.default.timeout,
+                self.default.lifetime,
+                self.redirect,
+            )
+            self._async_resolvers[key] = resolver
+        return resolver
+
+
+resolver_pool = ResolverPool()
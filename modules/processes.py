@@ -0,0 +1,100 @@
+# modules/processes.py
+
+import heapq
+import multiprocessing
+from collections import defaultdict, deque
+
+from .groups import schedule
+
+DEFAULT_CHUNK_SIZE = 200
+
+
+def tasks(domains, groups=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the domains as tasks of about chunk_size domains, each a list to scan in order.
+
+    Without groups a task holds consecutive domains. With the groups of
+    group_by_org() every organization stays within one task, in the order
+    of schedule(), so its hosts still find its DMARC record cached.
+    """
+    if groups is None:
+        for start in range(0, len(domains), chunk_size):
+            yield domains[start : start + chunk_size]
+        return
+    chunk = {}
+    size = 0
+    for org, members in groups.items():
+        chunk[org] = members
+        size += len(members)
+        if size >= chunk_size:
+            yield schedule(chunk)
+            chunk = {}
+            size = 0
+    if chunk:
+        yield schedule(chunk)
+
+
+def run_processes(run_task, task_list, processes, initializer, initargs=(), ordered=False):
+    """Yields run_task(task) for every task, run on a pool of worker processes.
+
+    Every worker calls initializer(*initargs) once when it starts. Outputs
+    come in task order when ordered is set, and as tasks finish otherwise.
+    Workers are spawned rather than forked, so no thread or socket of this
+    process is copied into them.
+    """
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, initializer, initargs) as pool:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        yield from mapper(run_task, task_list)
+
+
+def share(limit, processes):
+    """Returns one worker's share of a limit meant for all processes together.
+
+    0 (no limit) stays 0, and an integer limit leaves every worker at
+    least 1, so a limit below the number of processes is exceeded.
+    """
+    if not limit:
+        return limit
+    if isinstance(limit, int):
+        return max(1, limit // processes)
+    return limit / processes
+
+
+def in_input_order(results, domains):
+    """Yields results, which come in any order, in the order of their DOMAIN in domains.
+
+    A result is held back until every domain listed before it has its
+    result; results still held when the input ends are yielded last.
+    """
+    positions = defaultdict(deque)
+    for i, domain in enumerate(domains):
+        positions[domain].append(i)
+    held = []
+    next_position = 0
+    for result in results:
+        heapq.heappush(held, (positions[result["DOMAIN"]].popleft(), result))
+        while held and held[0][0] == next_position:
+            yield heapq.heappop(held)[1]
+            next_position += 1
+    while held:
+        yield heapq.heappop(held)[1]
+
+
+def subtract_counters(after, before):
+    """Returns after - before for (nested dicts of) counters, such as the stats() of a worker."""
+    return {
+        key: subtract_counters(value, before.get(key, {}))
+        if isinstance(value, dict)
+        else value - before.get(key, 0)
+        for key, value in after.items()
+    }
+
+
+def add_counters(totals, counters):
+    """Adds (nested dicts of) counters into totals."""
+    for key, value in counters.items():
+        if isinstance(value, dict):
+            add_counters(totals.setdefault(key, {}), value)
+        else:
+            totals[key] = totals.get(key, 0) + value
+    return totals
@@ -0,0 +1,150 @@
+# modules/providers.py
+
+from .spfterms import parse_spf
+
+# Mail providers recognizable from a domain's MX hosts or SPF includes, and
+# the DKIM selectors each of them signs with, most common first.
+PROVIDERS = {
+    "Google Workspace": {
+        "mx": ["google.com", "googlemail.com"],
+        "spf": ["_spf.google.com"],
+        "selectors": ["google", "20230601", "20221208", "20210112", "20161025"],
+    },
+    "Microsoft 365": {
+        "mx": ["mail.protection.outlook.com"],
+        "spf": ["spf.protection.outlook.com"],
+        "selectors": ["selector1", "selector2"],
+    },
+    "SendGrid": {
+        "mx": ["sendgrid.net"],
+        "spf": ["sendgrid.net"],
+        "selectors": ["s1", "s2", "smtpapi", "sendgrid"],
+    },
+    "Mailchimp": {
+        "mx": [],
+        "spf": ["servers.mcsv.net", "spf.mandrillapp.com", "mailchimpapp.net"],
+        "selectors": ["k1", "k2", "k3", "mandrill", "mte1", "mte2"],
+    },
+    "Mailgun": {
+        "mx": ["mailgun.org"],
+        "spf": ["mailgun.org"],
+        "selectors": ["krs", "mailo", "k1", "mg", "smtp", "mx"],
+    },
+    "Amazon SES": {
+        "mx": ["amazonaws.com"],
+        "spf": ["amazonses.com"],
+        "selectors": ["amazonses"],
+    },
+    "Zoho": {
+        "mx": ["zoho.com", "zoho.eu", "zoho.in"],
+        "spf": ["zoho.com", "zoho.eu", "zohomail.com"],
+        "selectors": ["zoho", "zmail", "zohomail", "zcmp"],
+    },
+    "Fastmail": {
+        "mx": ["messagingengine.com"],
+        "spf": ["spf.messagingengine.com"],
+        "selectors": ["fm1", "fm2", "fm3"],
+    },
+    "Proton": {
+        "mx": ["protonmail.ch"],
+        "spf": ["_spf.protonmail.ch"],
+        "selectors": ["protonmail", "protonmail2", "protonmail3"],
+    },
+    "Postmark": {
+        "mx": [],
+        "spf": ["spf.mtasv.net"],
+        "selectors": ["pm"],
+    },
+    "Mimecast": {
+        "mx": ["mimecast.com"],
+        "spf": ["mimecast.com"],
+        "selectors": ["mimecast20190104", "mimecast20170407", "mimecast"],
+    },
+    "Proofpoint": {
+        "mx": ["pphosted.com", "ppe-hosted.com"],
+        "spf": ["pphosted.com", "ppe-hosted.com"],
+        "selectors": ["pp", "ppdkim", "proofpoint"],
+    },
+    "Salesforce": {
+        "mx": [],
+        "spf": ["_spf.salesforce.com", "exacttarget.com"],
+        "selectors": ["sf1", "sf2", "200608"],
+    },
+    "HubSpot": {
+        "mx": [],
+        "spf": ["hubspotemail.net", "hubspot.com"],
+        "selectors": ["hs1", "hs2"],
+    },
+    "Zendesk": {
+        "mx": [],
+        "spf": ["mail.zendesk.com"],
+        "selectors": ["zendesk1", "zendesk2"],
+    },
+    "Constant Contact": {
+        "mx": [],
+        "spf": ["spf.constantcontact.com"],
+        "selectors": ["ctct1", "ctct2"],
+    },
+    "Brevo": {
+        "mx": [],
+        "spf": ["spf.sendinblue.com", "spf.brevo.com"],
+        "selectors": ["mail", "brevo1", "brevo2", "sendinblue"],
+    },
+    "Mailjet": {
+        "mx": [],
+        "spf": ["spf.mailjet.com"],
+        "selectors": ["mailjet"],
+    },
+    "Klaviyo": {
+        "mx": [],
+        "spf": ["klaviyo.com", "klaviyomail.com"],
+        "selectors": ["kl", "kl2"],
+    },
+    "Yahoo": {
+        "mx": ["yahoodns.net"],
+        "spf": ["_spf.mail.yahoo.com"],
+        "selectors": ["s1024", "s2048"],
+    },
+    "Yandex": {
+        "mx": ["yandex.net", "yandex.ru"],
+        "spf": ["_spf.yandex.net"],
+        "selectors": ["mail"],
+    },
+    "GoDaddy": {
+        "mx": ["secureserver.net"],
+        "spf": ["secureserver.net"],
+        "selectors": ["secureserver", "dkimgd"],
+    },
+}
+
+
+def _matches(host, suffixes):
+    host = host.lower().rstrip(".")
+    return any(host == suffix or host.endswith("." + suffix) for suffix in suffixes)
+
+
+def spf_includes(spf_record):
+    """Returns the domains an SPF record includes or redirects to."""
+    if not spf_record:
+        return []
+    return parse_spf(spf_record).targets
+
+
+def infer_providers(mx_hosts, includes):
+    """Returns the names of the providers the MX hosts and SPF includes point to, in PROVIDERS order."""
+    return [
+        name
+        for name, provider in PROVIDERS.items()
+        if any(_matches(host, provider["mx"]) for host in mx_hosts)
+        or any(_matches(include, provider["spf"]) for include in includes)
+    ]
+
+
+def provider_selectors(providers):
+    """Returns the DKIM selectors of the given providers, without duplicates."""
+    selectors = []
+    for name in providers:
+        for selector in PROVIDERS[name]["selectors"]:
+            if selector not in selectors:
+                selectors.append(selector)
+    return selectors
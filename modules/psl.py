@@ -0,0 +1,111 @@
+# modules/psl.py
+
+import io
+import os
+import threading
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+import requests
+import tldextract
+
+PSL_URL = "https://publicsuffix.org/list/public_suffix_list.dat"
+DEFAULT_PSL_FILE = ".spoofy_public_suffix_list.dat"
+DEFAULT_MAX_ENTRIES = 100000
+
+
+class _FileAdapter(requests.adapters.BaseAdapter):
+    """Serves file:// URLs to tldextract, closing each file once it is read.
+
+    The file adapter tldextract mounts itself leaves the file open.
+    """
+
+    def send(self, request, **kwargs):
+        path = urllib.request.url2pathname(urllib.parse.urlparse(request.url).path)
+        response = requests.Response()
+        with open(path, "rb") as f:
+            response.raw = io.BytesIO(f.read())
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class PublicSuffixes:
+    """Splits names into subdomain, registered domain and suffix from a pinned public suffix list.
+
+    The list is read from path when that file exists, and otherwise from
+    the snapshot bundled with tldextract; it is never fetched during a
+    scan. The extractor is built on first use and every name's result is
+    remembered, so the domains of a scan are split once each.
+    """
+
+    def __init__(self, path=DEFAULT_PSL_FILE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._extractor = None
+        self._results = {}
+        self._lock = threading.Lock()
+
+    @property
+    def extractor(self):
+        with self._lock:
+            if self._extractor is None:
+                urls = ()
+                if self.path and os.path.exists(self.path):
+                    urls = (Path(self.path).resolve().as_uri(),)
+                extractor = tldextract.TLDExtract(
+                    cache_dir=None, suffix_list_urls=urls, fallback_to_snapshot=True
+                )
+                # Load the list now, with a session that reads it from the file.
+                with requests.Session() as session:
+                    session.mount("file://", _FileAdapter())
+                    extractor("example.com", session=session)
+                self._extractor = extractor
+            return self._extractor
+
+    def extract(self, name):
+        """Returns the tldextract ExtractResult of name."""
+        result = self._results.get(name)
+        if result is None:
+            result = self.extractor(name)
+            with self._lock:
+                if len(self._results) >= self.max_entries:
+                    self._results.clear()
+                self._results[name] = result
+        return result
+
+    def registered_domain(self, name):
+        """Returns the organizational domain of name, e.g. example.co.uk for mail.example.co.uk.
+
+        It is "" when name has no domain under a public suffix, such as an IP address.
+        """
+        result = self.extract(name)
+        if not (result.domain and result.suffix):
+            return ""
+        return f"{result.domain}.{result.suffix}"
+
+    def is_subdomain(self, name):
+        return bool(self.extract(name).subdomain)
+
+    def refresh(self, url=PSL_URL, timeout=30):
+        """Downloads the public suffix list to path and uses it from now on; returns its size in bytes."""
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            data = response.read()
+        if b"===BEGIN ICANN DOMAINS===" not in data:
+            raise ValueError(f"{url} did not return a public suffix list")
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+        with self._lock:
+            self._extractor = None
+            self._results = {}
+        return len(data)
+
+
+public_suffixes = PublicSuffixes()
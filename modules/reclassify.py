@@ -0,0 +1,93 @@
+# modules/reclassify.py
+
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .classifier import FRAME_COLUMNS, classify_frame
+from .spoofing import SPOOFING_POSSIBLE, SPOOFING_TYPES, UNKNOWN_SPOOFING_TYPE
+
+DEFAULT_CHUNK_SIZE = 100000
+REQUIRED_COLUMNS = ("DOMAIN", *FRAME_COLUMNS)
+CODES = range(max(SPOOFING_TYPES) + 2)  # the last one stands for unknown codes
+
+
+def _read_jsonl(path, chunk_size):
+    # pandas would turn a column of integers with nulls into floats.
+    with open(path, encoding="utf-8") as f:
+        while True:
+            lines = [line for line in itertools.islice(f, chunk_size) if line.strip()]
+            if not lines:
+                return
+            yield pd.DataFrame([json.loads(line) for line in lines], dtype=object)
+
+
+def read_results(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the rows of a Spoofy output file (.xlsx, .csv or .jsonl) as DataFrames of at most chunk_size rows.
+
+    Every cell is kept as written: CSV cells as strings and blank cells as
+    missing, JSON and Excel values as they were stored. CSV and JSONL
+    files are read chunk by chunk; an Excel workbook is read whole and
+    then split.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xls"):
+        frame = pd.read_excel(path, dtype=object)
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start : start + chunk_size]
+    elif extension == ".csv":
+        with pd.read_csv(
+            path,
+            dtype=str,
+            keep_default_na=False,
+            na_values=[""],
+            chunksize=chunk_size,
+        ) as reader:
+            yield from reader
+    elif extension in (".jsonl", ".json"):
+        yield from _read_jsonl(path, chunk_size)
+    else:
+        raise ValueError(f"{path}: expected an .xlsx, .csv or .jsonl file")
+
+
+def reclassify_frame(frame):
+    """Returns frame with SPOOFING_POSSIBLE and SPOOFING_TYPE recomputed from its SPF and DMARC columns.
+
+    No other column is changed. The classifier reads missing cells as
+    None and the SPF query count as a number, even from a CSV file.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(missing)}")
+    inputs = frame[list(FRAME_COLUMNS)].copy()
+    inputs["SPF_NUM_DNS_QUERIES"] = pd.to_numeric(
+        inputs["SPF_NUM_DNS_QUERIES"], errors="coerce"
+    )
+    inputs = inputs.astype(object).where(inputs.notna(), None)
+    frame = frame.copy()
+    codes = classify_frame(inputs).to_numpy()
+    codes = np.where(np.isin(codes, list(SPOOFING_TYPES)), codes, CODES[-1])
+    possible = np.array([SPOOFING_POSSIBLE.get(code) for code in CODES], dtype=object)
+    types = np.array(
+        [SPOOFING_TYPES.get(code, UNKNOWN_SPOOFING_TYPE) + " for " for code in CODES],
+        dtype=object,
+    )
+    frame["SPOOFING_POSSIBLE"] = possible[codes]
+    frame["SPOOFING_TYPE"] = types[codes] + frame["DOMAIN"].astype(str) + "."
+    return frame
+
+
+def reclassify(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields (chunk, verdicts changed) for each chunk of a Spoofy output file, reclassified."""
+    for chunk in read_results(path, chunk_size):
+        before = chunk.get("SPOOFING_TYPE")
+        chunk = reclassify_frame(chunk)
+        changed = len(chunk)
+        if before is not None:
+            changed = int(
+                (before.to_numpy(dtype=object) != chunk["SPOOFING_TYPE"]).sum()
+            )
+        yield chunk, changed
@@ -0,0 +1,112 @@
+# modules/recording.py
+
+import json
+import threading
+
+import dns.resolver
+import dns.rrset
+
+NOERROR = "NOERROR"
+
+
+class DNSRecording:
+    """Records the outcome of every lookup sent to the network, or answers lookups from such a recording.
+
+    The file is append-only JSON Lines, one lookup per line:
+    {"q": qname, "t": type, "s": nameservers or null, "r": result, "ttl": ttl, "d": [rdata]}
+    where result is NOERROR or the name of the dns.resolver exception the
+    lookup raised (NXDOMAIN, NoAnswer, NoNameservers, LifetimeTimeout...).
+    When replaying, a lookup missing from the file fails like one that no
+    nameserver answered.
+    """
+
+    def __init__(self):
+        self.recorded = 0
+        self.replayed = 0
+        self.missing = 0
+        self._file = None
+        self._answers = None
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self):
+        return self._file is not None
+
+    @property
+    def replaying(self):
+        return self._answers is not None
+
+    def record(self, path):
+        """Appends every lookup made from now on to path."""
+        self._file = open(path, "a", encoding="utf-8")  # noqa: SIM115 - kept open for the scan
+
+    def replay(self, path):
+        """Loads path and answers every lookup from it instead of the network."""
+        answers = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = (entry["q"], entry["t"], tuple(entry["s"]) if entry["s"] else None)
+                # The file is append-only, so the latest run wins.
+                answers[key] = entry
+        self._answers = answers
+
+    def save(self, key, value, ttl):
+        """Writes the RRset or exception type a lookup produced."""
+        if self._file is None:
+            return
+        qname, rdtype, nameservers = key
+        entry = {
+            "q": qname,
+            "t": rdtype,
+            "s": list(nameservers) if nameservers else None,
+            "r": value.__name__ if isinstance(value, type) else NOERROR,
+            "ttl": ttl,
+        }
+        if not isinstance(value, type):
+            entry["d"] = [rdata.to_text() for rdata in value]
+            if value.name.to_text(omit_final_dot=True).lower() != qname:
+                entry["n"] = value.name.to_text()
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self.recorded += 1
+
+    def lookup(self, key):
+        """Returns (RRset or exception type, ttl) for key as recorded."""
+        entry = self._answers.get(key)
+        with self._lock:
+            if entry is None:
+                self.missing += 1
+            else:
+                self.replayed += 1
+        if entry is None:
+            return dns.resolver.NoNameservers, 0
+        if entry["r"] != NOERROR:
+            error = getattr(dns.resolver, entry["r"], None)
+            if not (isinstance(error, type) and issubclass(error, Exception)):
+                error = dns.resolver.NoNameservers
+            return error, entry["ttl"]
+        rrset = dns.rrset.from_text_list(
+            entry.get("n", entry["q"] + "."), entry["ttl"], "IN", entry["t"], entry["d"]
+        )
+        return rrset, entry["ttl"]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        """Returns how many lookups were recorded, replayed, or missing from the replayed file."""
+        with self._lock:
+            return {
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "missing": self.missing,
+            }
+
+
+dns_recording = DNSRecording()
@@ -1,6 +1,7 @@
 # modules/report.py
 
 import os
+import statistics
 import pandas as pd
 from colorama import init, Fore, Style
 
@@ -22,9 +23,9 @@ def output_message(symbol, message, level="info"):
     print(color + f"{symbol} {message}" + Style.RESET_ALL)
 
 
-def write_to_excel(data, file_name="output.xlsx"):
+def write_to_excel(data, file_name="output.xlsx", append=True):
     """Writes a DataFrame of data to an Excel file, appending if the file exists."""
-    if os.path.exists(file_name) and os.path.getsize(file_name) > 0:
+    if append and os.path.exists(file_name) and os.path.getsize(file_name) > 0:
         existing_df = pd.read_excel(file_name)
         new_df = pd.DataFrame(data)
         combined_df = pd.concat([existing_df, new_df])
@@ -33,14 +34,97 @@ def write_to_excel(data, file_name="output.xlsx"):
         pd.DataFrame(data).to_excel(file_name, index=False)
 
 
+def print_scan_stats(elapsed, durations):
+    """Prints the scan throughput and the spread of per-domain scan times."""
+    rate = len(durations) / elapsed if elapsed > 0 else 0
+    message = f"Scanned {len(durations)} domains in {elapsed:.2f}s ({rate:.1f} domains/s)"
+    if len(durations) > 1:
+        cuts = statistics.quantiles(durations, n=100, method="inclusive")
+        message += (
+            f", per domain p50 {cuts[49]:.3f}s, p95 {cuts[94]:.3f}s, "
+            f"p99 {cuts[98]:.3f}s, max {max(durations):.3f}s"
+        )
+    output_message("[*]", message, "indifferent")
+
+
+def print_cache_stats(stats):
+    """Prints the hit/miss counters of the shared DNS answer cache."""
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = 100 * stats["hits"] / lookups if lookups else 0
+    output_message(
+        "[*]",
+        f"DNS cache: {stats['hits']} hits ({stats['negative_hits']} negative), "
+        f"{stats['misses']} misses, {hit_rate:.1f}% hit rate, "
+        f"{stats['entries']} entries, {stats['evictions']} evictions",
+        "indifferent",
+    )
+
+
+def print_throttle_stats(stats):
+    """Prints how many queries the per-nameserver limits delayed, retried, or lost."""
+    output_message(
+        "[*]",
+        f"DNS throttling: {stats['throttled']} queries delayed, "
+        f"{stats['backoffs']} backoffs, {stats['failed']} lookups failed",
+        "indifferent",
+    )
+
+
+def print_group_stats(domains, organizations, stats):
+    """Prints how many organization DMARC lookups went out while grouping hosts by organizational domain."""
+    output_message(
+        "[*]",
+        f"Organization groups: {domains} domains in {organizations} organizations, "
+        f"{stats['sent']} organization DMARC lookups sent, "
+        f"{stats['sent'] - stats['distinct']} of them repeats",
+        "indifferent",
+    )
+
+
+def print_reclassify_stats(rows, changed, elapsed):
+    """Prints how many stored results were reclassified and how many verdicts changed."""
+    rate = rows / elapsed if elapsed > 0 else 0
+    output_message(
+        "[*]",
+        f"Reclassified {rows} results in {elapsed:.2f}s ({rate:.0f} results/s), "
+        f"{changed} verdicts changed",
+        "indifferent",
+    )
+
+
+def print_recording_stats(stats):
+    """Prints how many lookups were recorded to, or replayed from, a recording file."""
+    output_message(
+        "[*]",
+        f"DNS recording: {stats['recorded']} lookups recorded, "
+        f"{stats['replayed']} replayed, {stats['missing']} missing from the recording",
+        "indifferent",
+    )
+
+
+def print_spf_authorizations(prefix, domains):
+    """Prints the scanned domains whose SPF records authorize an address or network."""
+    if not domains:
+        output_message("[*]", f"No scanned domain's SPF authorizes {prefix}", "indifferent")
+        return
+    output_message(
+        "[*]",
+        f"SPF of {len(domains)} scanned domains authorizes {prefix}: {', '.join(domains)}",
+        "indifferent",
+    )
+
+
 def printer(**kwargs):
     """Utility function to print the results of DMARC, SPF, and BIMI checks in the original format."""
     domain = kwargs.get("DOMAIN")
     subdomain = kwargs.get("DOMAIN_TYPE") == "subdomain"
     dns_server = kwargs.get("DNS_SERVER")
+    dns_queries = kwargs.get("DNS_QUERIES")
     spf_record = kwargs.get("SPF")
     spf_all = kwargs.get("SPF_MULTIPLE_ALLS")
     spf_dns_query_count = kwargs.get("SPF_NUM_DNS_QUERIES")
+    spf_permerror = kwargs.get("SPF_PERMERROR")
+    spf_ipv4_addresses = kwargs.get("SPF_IPV4_ADDRESSES")
     dmarc_record = kwargs.get("DMARC")
     p = kwargs.get("DMARC_POLICY")
     pct = kwargs.get("DMARC_PCT")
@@ -54,6 +138,8 @@ def printer(**kwargs):
     authority = kwargs.get("BIMI_AUTHORITY")
     dkim_record = kwargs.get("DKIM")
     dkim_selector = kwargs.get("DKIM_SELECTOR")
+    dkim_selectors = kwargs.get("DKIM_SELECTORS")
+    dkim_failed_probes = kwargs.get("DKIM_FAILED_PROBES")
     dkim_version = kwargs.get("DKIM_VERSION")
     dkim_algorithm = kwargs.get("DKIM_ALGORITHM")
     dkim_key_length = kwargs.get("DKIM_KEY_LENGTH")
@@ -63,6 +149,7 @@ def printer(**kwargs):
     output_message("[*]", f"Domain: {domain}", "indifferent")
     output_message("[*]", f"Is subdomain: {subdomain}", "indifferent")
     output_message("[*]", f"DNS Server: {dns_server}", "indifferent")
+    output_message("[*]", f"DNS queries sent: {dns_queries}", "indifferent")
 
     if spf_record:
         output_message("[*]", f"SPF record: {spf_record}", "info")
@@ -81,6 +168,14 @@ def printer(**kwargs):
             else f"Too many SPF DNS query lookups {spf_dns_query_count}.",
             "info",
         )
+        if spf_permerror:
+            output_message(
+                "[?]", f"SPF evaluation fails (permerror): {spf_permerror}", "warning"
+            )
+        if spf_ipv4_addresses is not None:
+            output_message(
+                "[*]", f"SPF authorizes {spf_ipv4_addresses} IPv4 addresses", "info"
+            )
     else:
         output_message("[?]", "No SPF record found.", "warning")
 
@@ -130,6 +225,8 @@ def printer(**kwargs):
     if dkim_record:
         #output_message("[*]", f"DKIM record: {dkim_record}", "info")
         output_message("[*]", f"DKIM selector name found: {dkim_selector}", "info")
+        if dkim_selectors and dkim_selectors != dkim_selector:
+            output_message("[*]", f"All DKIM selectors found: {dkim_selectors}", "info")
         output_message("[*]", f"DKIM version: {dkim_version}", "info")
         output_message("[*]", f"DKIM encryption algorithm: {dkim_algorithm}", "info")
         output_message("[*]", f"DKIM public key length: {dkim_key_length} bits", "info")
@@ -149,6 +246,13 @@ def printer(**kwargs):
             output_message("[*]", f"DKIM key length: {dkim_key_length} bits", "info")
             
 
+    if dkim_failed_probes:
+        output_message(
+            "[!]",
+            f"{dkim_failed_probes} DKIM selector probes failed; the selectors found may be incomplete",
+            "warning",
+        )
+
     if spoofing_type:
         level = "good" if spoofable else "bad"
         symbol = "[+]" if level == "good" else "[-]"
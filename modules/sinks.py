@@ -0,0 +1,120 @@
+# modules/sinks.py
+
+import csv
+import json
+import os
+import threading
+import time
+
+FLUSH_ROWS = 1000
+FLUSH_SECONDS = 5.0
+
+
+class FileSink:
+    """Writes scan results to a file one at a time, as they arrive.
+
+    Rows are flushed every flush_rows rows or flush_seconds seconds, so a
+    crash loses at most that much and memory does not grow with the scan.
+    An existing file is appended to unless append is False.
+    """
+
+    def __init__(
+        self,
+        file_name,
+        append=True,
+        flush_rows=FLUSH_ROWS,
+        flush_seconds=FLUSH_SECONDS,
+    ):
+        self.file_name = file_name
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rows = 0
+        self._appending = (
+            append and os.path.exists(file_name) and os.path.getsize(file_name) > 0
+        )
+        mode = "a" if append else "w"
+        self._file = open(file_name, mode, encoding="utf-8", newline="")  # noqa: SIM115 - kept open for the scan
+        self._pending = 0
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, result):
+        """Writes one result dict."""
+        with self._lock:
+            self._write(result)
+            self.rows += 1
+            self._pending += 1
+            if (
+                self._pending >= self.flush_rows
+                or time.monotonic() - self._flushed >= self.flush_seconds
+            ):
+                self._flush()
+
+    def write_frame(self, frame):
+        """Writes every row of a DataFrame of results, in one go."""
+        with self._lock:
+            self._write_frame(frame)
+            self.rows += len(frame)
+            self._flush()
+
+    def _flush(self):
+        self._file.flush()
+        self._pending = 0
+        self._flushed = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+
+
+class JSONLSink(FileSink):
+    """Writes each result as one JSON object per line, keys in result order."""
+
+    def _write(self, result):
+        self._file.write(json.dumps(result, default=str) + "\n")
+
+    def _write_frame(self, frame):
+        if len(frame):
+            text = frame.to_json(orient="records", lines=True, default_handler=str)
+            self._file.write(text if text.endswith("\n") else text + "\n")
+
+
+class CSVSink(FileSink):
+    """Writes results as CSV rows, with a header of the first result's keys.
+
+    When appending to an existing file its header is kept, and results
+    with columns it does not have are refused.
+    """
+
+    def __init__(self, file_name, append=True, **kwargs):
+        super().__init__(file_name, append, **kwargs)
+        self._writer = None
+        if self._appending:
+            with open(file_name, "r", encoding="utf-8", newline="") as f:
+                header = next(csv.reader(f), None)
+            if header:
+                self._writer = csv.DictWriter(self._file, fieldnames=header)
+
+    def _write(self, result):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(result))
+            self._writer.writeheader()
+        self._writer.writerow(result)
+
+    def _write_frame(self, frame):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(frame.columns))
+            self._writer.writeheader()
+        extra = set(frame.columns) - set(self._writer.fieldnames)
+        if extra:
+            raise ValueError(
+                f"{self.file_name} has no columns {', '.join(sorted(extra))}"
+            )
+        frame.reindex(columns=self._writer.fieldnames).to_csv(
+            self._file, header=False, index=False
+        )
+
+
+SINKS = {"jsonl": JSONLSink, "csv": CSVSink}
@@ -1,28 +1,92 @@
+import ipaddress
+
 import dns.resolver
-import re
+
+from .cache import DNSCache
+from .lookup import LOOKUP_ERRORS, resolve, resolve_all
+from .networks import NetworkSet
+from .spfterms import parse_spf
+
+# Evaluated include/redirect subtrees, shared by every domain of the scan
+# and kept no longer than the TTLs of the records they were built from.
+spf_tree_cache = DNSCache()
+
+# RFC 7208 4.6.4: evaluating a record may take at most this many DNS
+# lookups, and at most this many of them may come back empty.
+LOOKUP_LIMIT = 10
+VOID_LOOKUP_LIMIT = 2
+# At most this many MX hosts of an mx mechanism are looked up (RFC 7208 4.6.4).
+MX_HOSTS_LIMIT = 10
+
+
+class SPFTree:
+    """The result of walking an SPF record and everything it includes or redirects to."""
+
+    def __init__(
+        self, lookups, all_mechanism, ttl, networks=None, voids=0, permerror=None
+    ):
+        self.lookups = lookups
+        self.all_mechanism = all_mechanism
+        self.ttl = ttl
+        self.networks = networks
+        self.voids = voids
+        self.permerror = permerror
+
+
+def _spf_records(answer):
+    """Returns the v=spf1 records of a TXT answer."""
+    records = [b"".join(rdata.strings).decode("utf-8", "replace") for rdata in answer]
+    return [record for record in records if record.startswith("v=spf1")]
+
+
+def _authorized(parsed):
+    """Returns (networks, hosts) for the pass mechanisms of a parsed record.
+
+    networks are its ip4/ip6 networks, and hosts its a and mx mechanisms as
+    (mechanism, domain or None, ipv4 prefix length, ipv6 prefix length).
+    Mechanisms with macros cannot be expanded and are left out.
+    """
+    networks = []
+    hosts = []
+    for term in parsed.terms:
+        if term.modifier or not term.passes:
+            continue
+        if term.name in ("ip4", "ip6") and term.value:
+            network = term.value if term.cidr is None else f"{term.value}/{term.cidr}"
+            try:
+                networks.append(ipaddress.ip_network(network, strict=False))
+            except ValueError:
+                pass
+        elif term.name in ("a", "mx") and "%" not in (term.value or ""):
+            hosts.append((term.name, term.value, term.cidr or 32, term.cidr6 or 128))
+    return networks, hosts
 
 
 class SPF:
     def __init__(self, domain, dns_server=None):
         self.domain = domain
         self.dns_server = dns_server
+        self._tree = None
+        self._networks = None
         self.spf_record = self.get_spf_record()
         self.all_mechanism = None
         self.spf_dns_query_count = 0
         self.too_many_dns_queries = False
+        self.permerror = None
 
         if self.spf_record:
             self.all_mechanism = self.get_spf_all_string()
             self.spf_dns_query_count = self.get_spf_dns_queries()
-            self.too_many_dns_queries = self.spf_dns_query_count > 10
+            self.too_many_dns_queries = self.spf_dns_query_count > LOOKUP_LIMIT
+            self.permerror = self.get_spf_tree().permerror
 
     def get_spf_record(self, domain=None):
         try:
             if not domain:
                 domain = self.domain
-            resolver = dns.resolver.Resolver()
-            resolver.nameservers = [self.dns_server, "1.1.1.1", "8.8.8.8"]
-            query_result = resolver.resolve(domain, "TXT")
+            query_result = resolve(
+                domain, "TXT", [self.dns_server, "1.1.1.1", "8.8.8.8"]
+            )
             for record in query_result:
                 if "spf1" in str(record):
                     spf_record = str(record).replace('"', "")
@@ -32,56 +96,253 @@ class SPF:
             return None
 
     def get_spf_all_string(self):
-        spf_record = self.spf_record
-        visited_domains = set()
-
-        while spf_record:
-            all_matches = re.findall(r"[-~?+]all", spf_record)
-            if len(all_matches) == 1:
-                return all_matches[0]
-            elif len(all_matches) > 1:
-                return "2many"
-
-            redirect_match = re.search(r"redirect=([\w.-]+)", spf_record)
-            if redirect_match:
-                redirect_domain = redirect_match.group(1)
-                if redirect_domain in visited_domains:
-                    break
-                visited_domains.add(redirect_domain)
-                spf_record = self.get_spf_record(redirect_domain)
-            else:
+        return self.get_spf_tree().all_mechanism
+
+    def get_spf_dns_queries(self):
+        return self.get_spf_tree().lookups
+
+    def get_spf_tree(self):
+        """Returns the SPFTree of the domain's record, walking it on first use."""
+        if self._tree is None:
+            self._tree = self.walk(self.domain, [self.spf_record], None, {self.domain})
+        return self._tree
+
+    def get_spf_networks(self):
+        """Returns the NetworkSet the domain's SPF record authorizes, or None without a record.
+
+        Every include, redirect, a and mx is expanded; this costs extra
+        lookups, so it is only done on request.
+        """
+        if not self.spf_record:
+            return None
+        if self._networks is None:
+            tree = self.walk(
+                self.domain, [self.spf_record], None, {self.domain}, flatten=True
+            )
+            self._networks = tree.networks
+        return self._networks
+
+    def nameservers_for(self, domain):
+        """Returns the nameservers to ask for an include or redirect target.
+
+        Names inside the domain go to its DNS server; others to the default
+        resolver, so subtrees such as _spf.google.com are shared by every
+        domain that includes them.
+        """
+        if self.dns_server and (
+            domain == self.domain or domain.endswith("." + self.domain)
+        ):
+            return [self.dns_server, "1.1.1.1", "8.8.8.8"]
+        return None
+
+    def walk(
+        self, domain, records, ttl, visiting, flatten=False, spent=0, spent_voids=0
+    ):
+        """Returns the SPFTree of records published at domain.
+
+        Include and redirect targets are fetched together, and each subtree is
+        taken from spf_tree_cache when another domain already walked it.
+        visiting holds the names on the current path, so an include loop is
+        caught there. spent and spent_voids are the lookups and void lookups
+        the evaluation took before reaching domain: the walk stops as soon as
+        the RFC 7208 limits are exceeded, since the result is a permerror
+        whatever the rest of the tree holds. With flatten, the tree also
+        carries the networks the records authorize: those of pass includes
+        and of a redirect that is not ignored, but not of -, ~ or ? includes.
+        """
+        lookups = 0
+        voids = 0
+        permerror = None
+        all_mechanism = parse_spf(records[0]).all_mechanism
+        targets = []
+        redirects = set()
+        authorizing = set()
+        for record in records:
+            parsed = parse_spf(record)
+            lookups += parsed.lookups
+            targets += parsed.targets
+            if parsed.redirect:
+                redirects.add(parsed.redirect)
+                # RFC 7208 6.1: a record with an all mechanism ignores its redirect.
+                if parsed.all_mechanism is None:
+                    authorizing.add(parsed.redirect)
+            authorizing.update(
+                term.value
+                for term in parsed.terms
+                if term.name == "include" and not term.modifier and term.passes
+            )
+
+        children = []
+        subtrees = []
+        fetch = []
+        if spent + lookups > LOOKUP_LIMIT:
+            permerror = f"more than {LOOKUP_LIMIT} DNS lookups at {domain}"
+            targets = []
+        for target in targets:
+            if target in visiting:
+                # Evaluating a loop never ends, so it always runs out of lookups.
+                permerror = f"include loop at {target}"
+                lookups = max(lookups, LOOKUP_LIMIT + 1)
+                children = fetch = []
                 break
+            nameservers = self.nameservers_for(target)
+            key = spf_tree_cache.make_key(
+                target, "SPF+NET" if flatten else "SPF", nameservers
+            )
+            subtree = spf_tree_cache.get(key)
+            children.append((target, key, subtree))
+            if subtree is None:
+                fetch.append((target, "TXT", nameservers))
+        answers = dict(
+            zip([name for name, _, _ in fetch], resolve_all(fetch, len(fetch)))
+        )
+
+        for target, key, subtree in children:
+            if subtree is None:
+                answer = answers[target]
+                if isinstance(answer, (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer)):
+                    voids += 1
+                    if spent_voids + voids > VOID_LOOKUP_LIMIT:
+                        permerror = (
+                            f"more than {VOID_LOOKUP_LIMIT} void lookups at {target}"
+                        )
+                        break
+                    continue
+                if isinstance(answer, Exception):
+                    continue
+                child_records = _spf_records(answer)
+                if not child_records:
+                    continue
+                subtree = self.walk(
+                    target,
+                    child_records,
+                    answer.ttl,
+                    visiting | {target},
+                    flatten,
+                    spent + lookups,
+                    spent_voids + voids,
+                )
+                # A subtree cut short by what this path already spent is
+                # not the whole subtree, so only keep complete ones.
+                if (
+                    subtree.permerror is None
+                    or subtree.lookups > LOOKUP_LIMIT
+                    or subtree.voids > VOID_LOOKUP_LIMIT
+                ):
+                    spf_tree_cache.put(key, subtree, subtree.ttl)
+            lookups += subtree.lookups
+            voids += subtree.voids
+            if subtree.ttl is not None:
+                ttl = subtree.ttl if ttl is None else min(ttl, subtree.ttl)
+            if all_mechanism is None and target in redirects:
+                all_mechanism = subtree.all_mechanism
+            if flatten and target in authorizing:
+                subtrees.append(subtree.networks)
+            if subtree.permerror:
+                permerror = subtree.permerror
+            elif spent + lookups > LOOKUP_LIMIT:
+                permerror = f"more than {LOOKUP_LIMIT} DNS lookups at {target}"
+            elif spent_voids + voids > VOID_LOOKUP_LIMIT:
+                permerror = f"more than {VOID_LOOKUP_LIMIT} void lookups at {target}"
+            if permerror:
+                break
+
+        if all_mechanism is None and permerror:
+            # The walk stopped before reaching the redirect, but its all
+            # mechanism is still what the domain ends in.
+            redirect = parse_spf(records[0]).redirect
+            if redirect:
+                all_mechanism = self.redirect_all(redirect, visiting)
 
+        networks = None
+        if flatten:
+            own, ttl = self.expand(domain, records, ttl)
+            networks = NetworkSet.union([own] + subtrees)
+        return SPFTree(lookups, all_mechanism, ttl, networks, voids, permerror)
+
+    def redirect_all(self, target, visiting):
+        """Returns the all mechanism a chain of redirects starting at target ends in, or None.
+
+        Only redirect modifiers are followed, at most LOOKUP_LIMIT of them,
+        and a name already in visiting ends the chain.
+        """
+        for _ in range(LOOKUP_LIMIT):
+            if target in visiting:
+                return None
+            visiting = visiting | {target}
+            try:
+                answer = resolve(target, "TXT", self.nameservers_for(target))
+            except LOOKUP_ERRORS:
+                return None
+            records = _spf_records(answer)
+            if not records:
+                return None
+            parsed = parse_spf(records[0])
+            if parsed.all_mechanism or not parsed.redirect:
+                return parsed.all_mechanism
+            target = parsed.redirect
         return None
 
-    def get_spf_dns_queries(self):
-        checked_domains = set()
-        domains_to_check = [self.domain]
-        count = 0
+    def expand(self, domain, records, ttl):
+        """Returns (NetworkSet, ttl) of the ip4, ip6, a and mx mechanisms of records published at domain."""
+        networks = []
+        hosts = []
+        for record in records:
+            own_networks, own_hosts = _authorized(parse_spf(record))
+            networks += own_networks
+            hosts += own_hosts
 
-        while domains_to_check:
-            current_domain = domains_to_check.pop()
-            if current_domain in checked_domains:
+        answers = {}
+        self.resolve_missing(
+            answers,
+            [
+                (target or domain, rdtype)
+                for mechanism, target, _, _ in hosts
+                for rdtype in (("MX",) if mechanism == "mx" else ("A", "AAAA"))
+            ],
+        )
+        addresses = []
+        for mechanism, target, cidr4, cidr6 in hosts:
+            target = target or domain
+            if mechanism == "a":
+                addresses.append((target, cidr4, cidr6))
                 continue
-            checked_domains.add(current_domain)
-            try:
-                answers = dns.resolver.resolve(current_domain, "TXT")
-                for rdata in answers:
-                    txt_record = rdata.to_text().strip('"')
-                    if txt_record.startswith("v=spf1"):
-                        for item in txt_record.split():
-                            if item.startswith(("include:", "redirect=")):
-                                url = item.split(":", 1)[1] if ":" in item else item.split("=", 1)[1]
-                                domains_to_check.append(url)
-                                count += 1
-                        count += len(re.findall(r"[ ,+]a[ ,:]", txt_record))
-                        count += len(re.findall(r"[ ,+]mx[ ,:]", txt_record))
-                        count += len(re.findall(r"[ ]ptr[ ]", txt_record))
-                        count += len(re.findall(r"exists[:]", txt_record))
-            except Exception:
+            answer = answers[target, "MX"]
+            if isinstance(answer, Exception):
                 continue
+            for rdata in list(answer)[:MX_HOSTS_LIMIT]:
+                host = rdata.exchange.to_text(omit_final_dot=True)
+                addresses.append((host, cidr4, cidr6))
+        self.resolve_missing(
+            answers,
+            [(host, rdtype) for host, _, _ in addresses for rdtype in ("A", "AAAA")],
+        )
 
-        return count
+        for host, cidr4, cidr6 in addresses:
+            for rdtype, cidr in (("A", cidr4), ("AAAA", cidr6)):
+                answer = answers[host, rdtype]
+                if isinstance(answer, Exception):
+                    continue
+                ttl = answer.ttl if ttl is None else min(ttl, answer.ttl)
+                for rdata in answer:
+                    try:
+                        networks.append(
+                            ipaddress.ip_network(
+                                f"{rdata.address}/{cidr}", strict=False
+                            )
+                        )
+                    except ValueError:
+                        pass
+        return NetworkSet(networks), ttl
+
+    def resolve_missing(self, answers, lookups):
+        """Resolves the (name, type) lookups not yet in answers, together, and adds them to it."""
+        missing = list(dict.fromkeys(key for key in lookups if key not in answers))
+        results = resolve_all(
+            [(name, rdtype, self.nameservers_for(name)) for name, rdtype in missing],
+            len(missing),
+        )
+        answers.update(zip(missing, results))
 
     def __str__(self):
         return (
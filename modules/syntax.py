@@ -1,58 +1,72 @@
 # modules/syntax.py
+import functools
 import re
 
-
-def validate_record_syntax(record, record_type):
-    """Validate the syntax of a DNS record (SPF or DMARC)."""
-
-    if record_type == "SPF":
-        mechanism_patterns = {
-            "all": r"^all$",
-            "include": r"^include:[\w\.\-]+\.[a-zA-Z]{2,}$",
-            "a": r"^a(:[\w\.\-]+)?$",
-            "mx": r"^mx(:[\w\.\-]+)?$",
-            "ptr": r"^ptr(:[\w\.\-]+)?$",
-            "ip4": r"^ip4:(\d{1,3}\.){3}\d{1,3}(\/\d{1,2})?$",
-            "ip6": r"^ip6:[a-fA-F0-9:]+(\/\d{1,3})?$",
-            "exists": r"^exists:[\w\.\-]+\.[a-zA-Z]{2,}$",
-        }
-
-        modifier_patterns = {
-            "redirect": r"^redirect=[\w\.\-]+\.[a-zA-Z]{2,}$",
-            "exp": r"^exp=[\w\.\-]+\.[a-zA-Z]{2,}$",
-        }
-
-        elements = record.split()
-
-        if len(elements) == 0 or elements[0].strip().lower() != "v=spf1":
+from .spfterms import PARSED_CACHE_SIZE, parse_spf
+
+DOMAIN = re.compile(r"^[\w\.\-]+\.[a-zA-Z]{2,}$")
+HOST = re.compile(r"^[\w\.\-]+$")
+SPF_VALUE_PATTERNS = {
+    "include": DOMAIN,
+    "exists": DOMAIN,
+    "a": HOST,
+    "mx": HOST,
+    "ptr": HOST,
+    "ip4": re.compile(r"^(\d{1,3}\.){3}\d{1,3}$"),
+    "ip6": re.compile(r"^[a-fA-F0-9:]+$"),
+}
+SPF_MODIFIER_PATTERNS = {"redirect": DOMAIN, "exp": DOMAIN}
+# The longest prefix each mechanism may carry after "/" and "//".
+SPF_CIDR_LIMITS = {
+    "a": (32, 128),
+    "mx": (32, 128),
+    "ip4": (32, None),
+    "ip6": (128, None),
+}
+# Mechanisms whose value is required rather than optional.
+SPF_REQUIRED_VALUES = {"include", "exists", "ip4", "ip6"}
+
+
+def _valid_spf_term(term):
+    """Returns whether one parsed SPF term is a known mechanism or modifier with a well-formed value."""
+    if term.modifier:
+        pattern = SPF_MODIFIER_PATTERNS.get(term.name)
+        return bool(
+            pattern
+            and not term.qualifier
+            and term.cidr is None
+            and term.cidr6 is None
+            and pattern.match(term.value)
+        )
+    if term.name == "all":
+        return term.value is None and term.cidr is None and term.cidr6 is None
+    pattern = SPF_VALUE_PATTERNS.get(term.name)
+    if pattern is None:
+        return False
+    if term.value is None:
+        if term.name in SPF_REQUIRED_VALUES:
             return False
+    elif not pattern.match(term.value):
+        return False
+    cidr_limit, cidr6_limit = SPF_CIDR_LIMITS.get(term.name, (None, None))
+    if term.cidr is not None and (cidr_limit is None or term.cidr > cidr_limit):
+        return False
+    return term.cidr6 is None or (cidr6_limit is not None and term.cidr6 <= cidr6_limit)
 
-        for element in elements[1:]:
-            element = element.strip()
 
-            if ":" in element:
-                mechanism, value = element.split(":", 1)
-            elif "=" in element:
-                modifier, value = element.split("=", 1)
-                mechanism = modifier
-            else:
-                mechanism = element
-                value = None
+@functools.lru_cache(maxsize=PARSED_CACHE_SIZE)
+def _valid_spf(record):
+    parsed = parse_spf(record)
+    if parsed.version != "v=spf1":
+        return False
+    return all(_valid_spf_term(term) for term in parsed.terms)
 
-            if mechanism in mechanism_patterns:
-                pattern = mechanism_patterns[mechanism]
-                if value:
-                    if not re.match(pattern, element):
-                        return False
-                elif not re.match(r"^" + mechanism + r"$", element):
-                    return False
 
-            elif mechanism in modifier_patterns:
-                pattern = modifier_patterns[mechanism]
-                if not re.match(pattern, element):
-                    return False
-            else:
-                return False
+def validate_record_syntax(record, record_type):
+    """Validate the syntax of a DNS record (SPF or DMARC)."""
+
+    if record_type == "SPF":
+        return record is not None and _valid_spf(record)
     elif record_type == "DMARC":
         tag_patterns = {
             "v": r"^DMARC1$",
@@ -0,0 +1,503 @@
+# modules/synthetic.py
+"""A synthetic authoritative DNS server for load testing Spoofy.
+
+It generates a reproducible set of domains with a chosen mix of SPF include
+chains, DMARC policies, BIMI and DKIM records, missing domains and truncated
+answers, and serves them over UDP and TCP with optional latency and loss.
+Point a scan at it with spoofy.py --dns-redirect:
+
+    python -m modules.synthetic --domains 10000 --write-domains bench.txt --port 5353
+    ./spoofy.py -iL bench.txt --dns-redirect 127.0.0.1:5353 -t 32
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import struct
+
+import dns.exception
+import dns.flags
+import dns.message
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+
+from .dkim import DEFAULT_SELECTORS_FILE, load_selectors
+
+TTL = 300
+NAMESERVER = "ns1.spoofy-bench.net"
+NAMESERVER_ADDRESS = "127.0.0.1"
+# A 1024-bit RSA SubjectPublicKeyInfo, so DKIM key lengths can be parsed.
+DKIM_KEY = (
+    "MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQCm4MbamVOe7P2s/6jUcHvbbdlrkY6vmyEzszX2YQanbqi"
+    "/mDRtCebqTcfLTg9UdpUguXdqp9mQ3o3QQUt+EDMPRF7jTR8XmZygCMMDZbga1Wc0bNsXKTHHWBSo7tt9b"
+    "cJz1KpdVrV7T2e01pB5H40ulhxPdl8Y5FLg79dbiDzeLQIDAQAB"
+)
+DEFAULT_DMARC_MIX = {"reject": 0.3, "quarantine": 0.2, "none": 0.3}
+SPF_ALLS = ["-all", "~all", "?all"]
+# SPF includes shared by many domains, like a mail provider's _spf record.
+ESP_COUNT = 5
+# Depth of the include chains of hostile SPF records, which end in a loop.
+RUNAWAY_DEPTH = 40
+# Domains with DKIM publish one of the most common selectors.
+DKIM_SELECTORS = load_selectors(DEFAULT_SELECTORS_FILE)[:40]
+
+
+class SyntheticZone:
+    """The records of count generated domains, keyed by (name, type) with lowercase absolute names.
+
+    Every random choice comes from seed, so the same arguments always give
+    the same zone. spf_depth is the longest chain of SPF includes, and the
+    rates are the fractions of domains that get each feature; esp_rate is the
+    fraction of SPF records that also include one of a few shared providers,
+    and runaway_rate the fraction that are include chains RUNAWAY_DEPTH deep
+    looping back to the domain.
+    """
+
+    def __init__(
+        self,
+        count,
+        seed=0,
+        suffix="com",
+        spf_rate=0.9,
+        spf_depth=3,
+        dmarc_mix=None,
+        bimi_rate=0.1,
+        dkim_rate=0.5,
+        nxdomain_rate=0.05,
+        truncate_rate=0.02,
+        esp_rate=0.5,
+        runaway_rate=0,
+    ):
+        self.domains = []
+        self.records = {}
+        self.names = set()
+        self.apexes = set()
+        self.truncated = set()
+        rng = random.Random(seed)
+        dmarc_mix = DEFAULT_DMARC_MIX if dmarc_mix is None else dmarc_mix
+
+        self.add(NAMESERVER, "A", NAMESERVER_ADDRESS)
+        esps = []
+        for n in range(ESP_COUNT):
+            esp = f"_spf.esp{n}.spoofy-bench.net"
+            self.add(
+                esp,
+                "TXT",
+                f'"v=spf1 ip4:203.0.{n}.0/24 include:_spf2.esp{n}.spoofy-bench.net ~all"',
+            )
+            self.add(
+                f"_spf2.esp{n}.spoofy-bench.net",
+                "TXT",
+                f'"v=spf1 ip6:2001:db8:{n}::/48 ~all"',
+            )
+            esps.append(esp)
+        for i in range(count):
+            domain = f"bench-{i:06d}.{suffix}"
+            self.domains.append(domain)
+            if rng.random() < nxdomain_rate:
+                continue
+            self.apexes.add(domain + ".")
+            self.add(
+                domain,
+                "SOA",
+                f"{NAMESERVER}. hostmaster.{domain}. 1 7200 3600 1209600 {TTL}",
+            )
+            if rng.random() < truncate_rate:
+                self.truncated.add(domain + ".")
+            if rng.random() < spf_rate:
+                esp = rng.choice(esps) if rng.random() < esp_rate else None
+                if runaway_rate and rng.random() < runaway_rate:
+                    self.add_spf(domain, RUNAWAY_DEPTH, "-all", esp, loop=True)
+                else:
+                    self.add_spf(
+                        domain, rng.randint(0, spf_depth), rng.choice(SPF_ALLS), esp
+                    )
+            policy = self.pick(rng, dmarc_mix)
+            if policy:
+                self.add(
+                    f"_dmarc.{domain}",
+                    "TXT",
+                    f'"v=DMARC1; p={policy}; rua=mailto:dmarc@{domain}"',
+                )
+            if rng.random() < bimi_rate:
+                self.add(
+                    f"default._bimi.{domain}",
+                    "TXT",
+                    f'"v=BIMI1; l=https://{domain}/logo.svg"',
+                )
+            if rng.random() < dkim_rate:
+                selector = rng.choice(DKIM_SELECTORS)
+                self.add(
+                    f"{selector}._domainkey.{domain}",
+                    "TXT",
+                    f'"v=DKIM1; k=rsa; p={DKIM_KEY}"',
+                )
+
+    @staticmethod
+    def pick(rng, mix):
+        """Returns a key of mix with the probability given by its value, or None for the rest."""
+        roll = rng.random()
+        for choice, rate in mix.items():
+            if roll < rate:
+                return choice
+            roll -= rate
+        return None
+
+    def add(self, name, rdtype, rdata):
+        name = name.lower() + "."
+        self.records.setdefault((name, rdtype), []).append(rdata)
+        # Parent names exist too (empty non-terminals get NODATA, not NXDOMAIN).
+        while name and name not in self.names:
+            self.names.add(name)
+            name = name.partition(".")[2]
+
+    def add_spf(self, domain, depth, all_mechanism, esp=None, loop=False):
+        """Adds an SPF record whose includes nest depth levels deep, also including esp if given.
+
+        With loop, the deepest record includes the domain again.
+        """
+        names = [domain] + [f"_spf{level}.{domain}" for level in range(1, depth + 1)]
+        for level, name in enumerate(names):
+            network = f"ip4:198.51.{level}.0/24"
+            if level == 0 and esp:
+                network += f" include:{esp}"
+            if level < depth or loop:
+                target = names[level + 1] if level < depth else domain
+                self.add(
+                    name, "TXT", f'"v=spf1 {network} include:{target} {all_mechanism}"'
+                )
+            else:
+                self.add(name, "TXT", f'"v=spf1 {network} {all_mechanism}"')
+
+    def apex(self, name):
+        """Returns the generated domain that name belongs to, or None."""
+        labels = name.split(".")
+        for i in range(len(labels) - 1):
+            candidate = ".".join(labels[i:])
+            if candidate in self.apexes:
+                return candidate
+        return None
+
+    def respond(self, query, tcp=False):
+        """Returns the response message for query."""
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        question = query.question[0]
+        name = question.name.to_text().lower()
+        rdtype = dns.rdatatype.to_text(question.rdtype)
+        apex = self.apex(name)
+
+        if apex in self.truncated and not tcp:
+            response.flags |= dns.flags.TC
+            return response
+        answer = self.records.get((name, rdtype))
+        if answer:
+            response.answer.append(
+                dns.rrset.from_text_list(
+                    question.name, TTL, dns.rdataclass.IN, rdtype, answer
+                )
+            )
+            return response
+        if name not in self.names:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        if apex:
+            response.authority.append(
+                dns.rrset.from_text_list(
+                    apex, TTL, dns.rdataclass.IN, "SOA", self.records[(apex, "SOA")]
+                )
+            )
+        return response
+
+    def zone_text(self):
+        """Returns the zone in master file format with absolute names."""
+        lines = []
+        for (name, rdtype), rdatas in self.records.items():
+            for rdata in rdatas:
+                lines.append(f"{name} {TTL} IN {rdtype} {rdata}")
+        return "\n".join(lines) + "\n"
+
+
+def _question_end(data):
+    """Returns the offset just past the QNAME of a wire-format query."""
+    offset = 12
+    while data[offset]:
+        offset += data[offset] + 1
+    return offset + 1
+
+
+class _Responder:
+    """Answers queries for a SyntheticZone, rendering each distinct question only once."""
+
+    def __init__(self, zone, latency=0.0, jitter=0.0, loss=0.0, seed=0):
+        self.zone = zone
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.queries = 0
+        self._rendered = {}
+
+    def answer(self, data, tcp=False):
+        """Returns the wire-format response to the wire-format query data, or None to drop it."""
+        self.queries += 1
+        try:
+            end = _question_end(data)
+            key = (data[12:end].lower() + data[end:], tcp)
+        except IndexError:
+            return None
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            try:
+                query = dns.message.from_wire(data)
+                rendered = self.zone.respond(query, tcp).to_wire()[2:]
+            except (dns.exception.DNSException, IndexError):
+                return None
+            self._rendered[key] = rendered
+        return data[:2] + rendered
+
+    def delay(self):
+        if not self.latency and not self.jitter:
+            return 0
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+
+class _UDPServer(asyncio.DatagramProtocol):
+    def __init__(self, responder):
+        self.responder = responder
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        responder = self.responder
+        if responder.loss and responder.rng.random() < responder.loss:
+            return
+        response = responder.answer(data)
+        if response is None:
+            return
+        delay = responder.delay()
+        if delay:
+            asyncio.get_running_loop().call_later(
+                delay, self.transport.sendto, response, addr
+            )
+        else:
+            self.transport.sendto(response, addr)
+
+
+async def _serve_tcp(responder, reader, writer):
+    try:
+        while True:
+            (length,) = struct.unpack("!H", await reader.readexactly(2))
+            response = responder.answer(await reader.readexactly(length), tcp=True)
+            if response is None:
+                break
+            delay = responder.delay()
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(struct.pack("!H", len(response)) + response)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(
+    zone,
+    host="127.0.0.1",
+    port=5353,
+    latency=0.0,
+    jitter=0.0,
+    loss=0.0,
+    seed=0,
+    reuse_port=False,
+):
+    """Serves zone over UDP and TCP on host:port until cancelled."""
+    responder = _Responder(zone, latency, jitter, loss, seed)
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _UDPServer(responder),
+        local_addr=(host, port),
+        reuse_port=reuse_port or None,
+    )
+    server = await asyncio.start_server(
+        lambda r, w: _serve_tcp(responder, r, w),
+        host,
+        port,
+        reuse_port=reuse_port or None,
+    )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        transport.close()
+
+
+def parse_mix(text):
+    """Parses a DMARC policy mix such as "reject=0.3,quarantine=0.2,none=0.3"."""
+    mix = {}
+    for part in text.split(","):
+        if part.strip():
+            policy, rate = part.split("=")
+            mix[policy.strip()] = float(rate)
+    return mix
+
+
+def _run(zone, args, reuse_port):
+    try:
+        asyncio.run(
+            serve(
+                zone,
+                args.host,
+                args.port,
+                args.latency / 1000,
+                args.jitter / 1000,
+                args.loss,
+                args.seed,
+                reuse_port,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve a generated set of domains to load test Spoofy."
+    )
+    parser.add_argument(
+        "--domains", type=int, default=1000, help="Number of domains to generate"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for the generated zone, latency and loss",
+    )
+    parser.add_argument(
+        "--suffix", type=str, default="com", help="Suffix of the generated domains"
+    )
+    parser.add_argument(
+        "--spf-rate", type=float, default=0.9, help="Fraction of domains with SPF"
+    )
+    parser.add_argument(
+        "--spf-depth", type=int, default=3, help="Longest chain of SPF includes"
+    )
+    parser.add_argument(
+        "--dmarc",
+        type=parse_mix,
+        default=DEFAULT_DMARC_MIX,
+        help="DMARC policy mix, e.g. reject=0.3,quarantine=0.2,none=0.3 (the rest get no record)",
+    )
+    parser.add_argument(
+        "--bimi-rate", type=float, default=0.1, help="Fraction of domains with BIMI"
+    )
+    parser.add_argument(
+        "--dkim-rate",
+        type=float,
+        default=0.5,
+        help="Fraction of domains with a DKIM selector",
+    )
+    parser.add_argument(
+        "--nxdomain-rate",
+        type=float,
+        default=0.05,
+        help="Fraction of domains that do not exist",
+    )
+    parser.add_argument(
+        "--truncate-rate",
+        type=float,
+        default=0.02,
+        help="Fraction of domains answered truncated over UDP",
+    )
+    parser.add_argument(
+        "--esp-rate",
+        type=float,
+        default=0.5,
+        help="Fraction of SPF records that include a shared provider's record",
+    )
+    parser.add_argument(
+        "--runaway-rate",
+        type=float,
+        default=0,
+        help="Fraction of SPF records that are deep include chains ending in a loop",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="Added latency per answer, in milliseconds",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0,
+        help="Random +/- variation of the latency, in milliseconds",
+    )
+    parser.add_argument(
+        "--loss", type=float, default=0, help="Fraction of UDP queries dropped"
+    )
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Address to listen on"
+    )
+    parser.add_argument("--port", type=int, default=5353, help="Port to listen on")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of server processes sharing the port",
+    )
+    parser.add_argument(
+        "--write-domains",
+        type=str,
+        help="Write the generated domains to this file, for -iL",
+    )
+    parser.add_argument(
+        "--write-zone", type=str, help="Write the generated records to this file"
+    )
+    args = parser.parse_args(argv)
+
+    zone = SyntheticZone(
+        args.domains,
+        args.seed,
+        args.suffix,
+        args.spf_rate,
+        args.spf_depth,
+        args.dmarc,
+        args.bimi_rate,
+        args.dkim_rate,
+        args.nxdomain_rate,
+        args.truncate_rate,
+        args.esp_rate,
+        args.runaway_rate,
+    )
+    if args.write_domains:
+        with open(args.write_domains, "w") as f:
+            f.write("\n".join(zone.domains) + "\n")
+    if args.write_zone:
+        with open(args.write_zone, "w") as f:
+            f.write(zone.zone_text())
+
+    print(f"Serving {len(zone.domains)} domains on {args.host}:{args.port}")
+    if args.processes <= 1:
+        _run(zone, args, False)
+        return
+    workers = [
+        multiprocessing.Process(target=_run, args=(zone, args, True))
+        for _ in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
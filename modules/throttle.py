@@ -0,0 +1,129 @@
+# modules/throttle.py
+
+import asyncio
+import contextlib
+import threading
+import time
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.25
+DEFAULT_MAX_BACKOFF = 8.0
+
+
+class _NameserverState:
+    def __init__(self):
+        self.next_slot = 0.0
+        self.backoff_until = 0.0
+        self.penalty = 0
+        self.inflight = None
+        self.async_inflight = None
+
+
+class Throttle:
+    """Politeness limits for each nameserver IP: max QPS, max in-flight queries and backoff.
+
+    A limit of 0 means unlimited. While a limit is set, every timeout, REFUSED
+    or SERVFAIL from a server doubles the pause before its next query (up to
+    max_backoff), and a good answer lifts it. Without limits there is no
+    backoff, as a lost packet says little about a server nobody asked us to
+    spare. Counters tell queries delayed by the limits apart from retries
+    after a backoff and from lookups that failed for good.
+    """
+
+    def __init__(
+        self,
+        max_qps=0,
+        max_inflight=0,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        max_backoff=DEFAULT_MAX_BACKOFF,
+    ):
+        self.max_qps = max_qps
+        self.max_inflight = max_inflight
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.throttled = 0
+        self.backoffs = 0
+        self.failed = 0
+        self._servers = {}
+        self._lock = threading.Lock()
+
+    def _state(self, nameserver):
+        state = self._servers.get(nameserver)
+        if state is None:
+            state = self._servers[nameserver] = _NameserverState()
+        return state
+
+    def reserve(self, nameserver):
+        """Books the next send slot for nameserver and returns how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(nameserver)
+            slot = max(now, state.next_slot)
+            interval = 1 / self.max_qps if self.max_qps > 0 else 0
+            state.next_slot = slot + interval
+            # A backoff holds this query back without queueing later ones behind it.
+            delay = max(slot, state.backoff_until) - now
+            if delay > 0:
+                self.throttled += 1
+        return delay
+
+    def inflight(self, nameserver):
+        """Returns the context manager bounding threads in flight to nameserver."""
+        if self.max_inflight <= 0:
+            return contextlib.nullcontext()
+        with self._lock:
+            state = self._state(nameserver)
+            if state.inflight is None:
+                state.inflight = threading.BoundedSemaphore(self.max_inflight)
+            return state.inflight
+
+    def inflight_async(self, nameserver):
+        """Returns the context manager bounding coroutines in flight to nameserver.
+
+        An asyncio.Semaphore belongs to the event loop it was first used on,
+        and every scan wave runs its own loop, so one is kept per loop.
+        """
+        if self.max_inflight <= 0:
+            return contextlib.nullcontext()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._state(nameserver)
+            if state.async_inflight is None or state.async_inflight[0] is not loop:
+                state.async_inflight = (loop, asyncio.Semaphore(self.max_inflight))
+            return state.async_inflight[1]
+
+    def penalize(self, nameserver):
+        """Pauses queries to nameserver after a timeout, REFUSED or SERVFAIL, when a limit is set."""
+        if self.max_qps <= 0 and self.max_inflight <= 0:
+            return
+        with self._lock:
+            state = self._state(nameserver)
+            pause = min(self.backoff * 2**state.penalty, self.max_backoff)
+            state.penalty += 1
+            state.backoff_until = max(state.backoff_until, time.monotonic() + pause)
+            self.backoffs += 1
+
+    def reward(self, nameserver):
+        """Clears the backoff of nameserver after a good answer."""
+        with self._lock:
+            state = self._state(nameserver)
+            state.penalty = 0
+            state.backoff_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def stats(self):
+        """Returns the throttled/backoff/failed counters."""
+        with self._lock:
+            return {
+                "throttled": self.throttled,
+                "backoffs": self.backoffs,
+                "failed": self.failed,
+            }
+
+
+throttle = Throttle()
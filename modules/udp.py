@@ -0,0 +1,190 @@
+# modules/udp.py
+
+import asyncio
+import contextvars
+import random
+import socket
+
+import dns.asyncquery
+import dns.exception
+import dns.flags
+import dns.inet
+import dns.message
+
+DEFAULT_SOCKETS = 4
+DEFAULT_RETRANSMITS = 2
+# Each socket asks for this much receive buffer; the kernel may grant less.
+RECEIVE_BUFFER = 1 << 20
+# What one small answer costs in a receive buffer, kernel overhead included.
+BUFFER_PER_ANSWER = 2048
+
+_multiplexer = contextvars.ContextVar("udp_multiplexer", default=None)
+
+
+def current_multiplexer():
+    """Returns the UDPMultiplexer serving the running scan, or None."""
+    return _multiplexer.get()
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    """One UDP socket carrying many outstanding queries, matched by message ID."""
+
+    def __init__(self):
+        self.transport = None
+        self.outstanding = {}
+        self.window = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        except OSError:
+            pass
+        buffer = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        # No more queries in flight than the socket can hold the answers of.
+        self.window = asyncio.Semaphore(max(buffer // BUFFER_PER_ANSWER, 1))
+
+    def datagram_received(self, data, addr):
+        if len(data) < 12:
+            return
+        entry = self.outstanding.get(int.from_bytes(data[:2], "big"))
+        if entry is None:
+            return
+        request, destination, future = entry
+        if addr[:2] != destination[:2] or future.done():
+            return
+        try:
+            response = dns.message.from_wire(data, ignore_trailing=True)
+        except dns.exception.DNSException:
+            return
+        # A late answer to an earlier query that reused this ID, or a forged
+        # one, carries the wrong question and is dropped. The ID already
+        # picked the entry; request.id has moved on if it was retransmitted.
+        if response.flags & dns.flags.QR and response.question == request.question:
+            future.set_result(response)
+
+    def error_received(self, exc):
+        pass
+
+    def connection_lost(self, exc):
+        for _, _, future in self.outstanding.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionError("socket closed"))
+
+
+class UDPMultiplexer:
+    """Pipelines many DNS queries over a few UDP sockets per address family.
+
+    Each query gets a random message ID that is unique on its socket; replies
+    are matched by ID, source address and question. A socket carries no more
+    queries at once than its receive buffer holds answers for, so a burst of
+    replies is not dropped by the kernel. A query that is not answered is
+    retransmitted with a new ID, each wait twice the one before, and an
+    answer to any of its IDs is taken. A truncated answer is retried over
+    TCP. Callers get a dns.message.Message, as from dns.asyncquery.udp.
+    """
+
+    def __init__(self, sockets=DEFAULT_SOCKETS, retransmits=DEFAULT_RETRANSMITS):
+        self.sockets = sockets
+        self.retransmits = retransmits
+        self.sent = 0
+        self.received = 0
+        self.retransmitted = 0
+        self._protocols = {}
+        self._next = 0
+
+    async def _open(self, af):
+        loop = asyncio.get_running_loop()
+        local = "::" if af == socket.AF_INET6 else "0.0.0.0"
+        protocols = []
+        for _ in range(self.sockets):
+            _, protocol = await loop.create_datagram_endpoint(
+                _QueryProtocol, local_addr=(local, 0), family=af
+            )
+            protocols.append(protocol)
+        self._protocols[af] = protocols
+        return protocols
+
+    async def _protocol(self, af):
+        protocols = self._protocols.get(af)
+        if protocols is None:
+            protocols = await self._open(af)
+        self._next += 1
+        return protocols[self._next % len(protocols)]
+
+    @staticmethod
+    def _new_id(protocol):
+        while True:
+            query_id = random.getrandbits(16)
+            if query_id not in protocol.outstanding:
+                return query_id
+
+    async def query(self, request, where, timeout, port=53):
+        """Sends request to where and returns the response, raising dns.exception.Timeout."""
+        af = dns.inet.af_for_address(where)
+        destination = (where, port)
+        loop = asyncio.get_running_loop()
+        attempts = self.retransmits + 1
+        deadline = loop.time() + timeout
+        # Waits of 1, 2, 4... parts that add up to the timeout.
+        part = timeout / (2**attempts - 1)
+
+        protocol = await self._protocol(af)
+        async with protocol.window:
+            future = loop.create_future()
+            ids = []
+            try:
+                for attempt in range(attempts):
+                    request.id = self._new_id(protocol)
+                    ids.append(request.id)
+                    protocol.outstanding[request.id] = (request, destination, future)
+                    protocol.transport.sendto(request.to_wire(), destination)
+                    self.sent += 1
+                    if attempt:
+                        self.retransmitted += 1
+                    wait = part * 2**attempt
+                    if attempt == attempts - 1:
+                        wait = deadline - loop.time()
+                    try:
+                        response = await asyncio.wait_for(
+                            asyncio.shield(future), max(wait, 0)
+                        )
+                        break
+                    except asyncio.TimeoutError:  # noqa: UP041 - TimeoutError only from 3.11
+                        continue
+                else:
+                    raise dns.exception.Timeout(timeout=timeout)
+            finally:
+                for query_id in ids:
+                    protocol.outstanding.pop(query_id, None)
+                if not future.done():
+                    future.cancel()
+
+        self.received += 1
+        if response.flags & dns.flags.TC:
+            remaining = max(deadline - loop.time(), 0.1)
+            response = await dns.asyncquery.tcp(request, where, remaining, port)
+        return response
+
+    def close(self):
+        for protocols in self._protocols.values():
+            for protocol in protocols:
+                if protocol.transport:
+                    protocol.transport.close()
+        self._protocols = {}
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "retransmitted": self.retransmitted,
+        }
+
+    def __enter__(self):
+        self._token = _multiplexer.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _multiplexer.reset(self._token)
+        self.close()
@@ -1,26 +1,54 @@
 #! /usr/bin/env python3
 
 import argparse
+import ipaddress
+import os
 import threading
+import time
 from queue import Queue
+from modules.dkim import (
+    DEFAULT_SELECTORS_FILE,
+    load_selectors,
+    selector_sweep,
+)
 from modules.dns import DNS
-from modules.spf import SPF
-from modules.dmarc import DMARC
-from modules.bimi import BIMI
-from modules.dkim import DKIM
+from modules.engine import DEFAULT_MAX_INFLIGHT, run_async
+from modules.groups import group_by_org, org_lookups, schedule
+from modules.hedge import discovery_latency
+from modules.lookup import QueryCounter
+from modules.networks import spf_networks
+from modules.pool import resolver_pool
+from modules.processes import (
+    add_counters,
+    in_input_order,
+    run_processes,
+    share,
+    subtract_counters,
+    tasks,
+)
+from modules.psl import public_suffixes
+from modules.reclassify import reclassify
+from modules.recording import dns_recording
+from modules.sinks import SINKS
+from modules.throttle import throttle
 from modules.spoofing import Spoofing
 from modules import report
+from modules.cache import answer_cache
 from modules.clean import clean_domains_from_file
 
 print_lock = threading.Lock()
 
 
 def process_domain(domain):
-    dns_info = DNS(domain)
-    spf = SPF(domain, dns_info.dns_server)
-    dmarc = DMARC(domain, dns_info.dns_server)
-    bimi_info = BIMI(domain, dns_info.dns_server)
-    dkim = DKIM(domain, dns_info.dns_server)
+    with QueryCounter() as query_counter:
+        dns_info = DNS(domain)
+        networks = None
+        if spf_networks.enabled:
+            networks = dns_info.spf_record.get_spf_networks()
+    spf = dns_info.spf_record
+    dmarc = dns_info.dmarc_record
+    bimi_info = dns_info.bimi_record
+    dkim = dns_info.dkim_record
 
     spoofing_info = Spoofing(
         domain,
@@ -33,15 +61,22 @@ def process_domain(domain):
         dmarc.sp,
         dmarc.pct,
     )
+    if networks is not None:
+        spf_networks.add(domain, networks)
 
     return {
         "DOMAIN": domain,
         "DOMAIN_TYPE": spoofing_info.domain_type,
         "DNS_SERVER": dns_info.dns_server,
+        "DNS_QUERIES": query_counter.queries,
         "SPF": spf.spf_record,
         "SPF_MULTIPLE_ALLS": spf.all_mechanism,
         "SPF_NUM_DNS_QUERIES": spf.spf_dns_query_count,
         "SPF_TOO_MANY_DNS_QUERIES": spf.too_many_dns_queries,
+        "SPF_PERMERROR": spf.permerror,
+        "SPF_IPV4_ADDRESSES": networks.num_addresses(4)
+        if networks is not None
+        else None,
         "DMARC": dmarc.dmarc_record,
         "DMARC_POLICY": dmarc.policy,
         "DMARC_PCT": dmarc.pct,
@@ -55,28 +90,243 @@ def process_domain(domain):
         "BIMI_AUTHORITY": bimi_info.authority,
         "DKIM": dkim.dkim_record,
         "DKIM_SELECTOR": dkim.selector,
+        "DKIM_SELECTORS": ", ".join(dkim.selectors),
+        "DKIM_FAILED_PROBES": dkim.failed_probes,
         "DKIM_VERSION": dkim.version,
         "DKIM_ALGORITHM": dkim.algorithm,
         "DKIM_KEY_LENGTH": dkim.key_length,
+        "DKIM_KEY_TYPE": dkim.key_type,
+        "DKIM_KEY_FINGERPRINT": dkim.key_fingerprint,
         "SPOOFING_POSSIBLE": spoofing_info.spoofing_possible,
         "SPOOFING_TYPE": spoofing_info.spoofing_type,
     }
 
 
-def worker(domain_queue, print_lock, output, results):
+def worker(domain_queue, print_lock, handle_result, durations):
     while True:
         domain = domain_queue.get()
         if domain is None:
             break
+        started = time.monotonic()
         result = process_domain(domain)
         with print_lock:
-            if output == "stdout":
-                report.printer(**result)
-            else:
-                results.append(result)
+            durations.append(time.monotonic() - started)
+            handle_result(result)
         domain_queue.task_done()
 
 
+def learning_selectors(handle_result):
+    """Returns handle_result, first ending each result's domain in the DKIM selector sweep.
+
+    The selectors are learned here, once per completed domain, rather than
+    in process_domain, which the async engine runs again on every pass.
+    """
+
+    def handle(result):
+        selectors = result["DKIM_SELECTORS"]
+        selector_sweep.finish(
+            result["DOMAIN"],
+            selectors.split(", ") if selectors else [],
+            complete=not result["DKIM_FAILED_PROBES"],
+        )
+        handle_result(result)
+
+    return handle
+
+
+def result_handler(output, results, sink):
+    """Returns the function that takes each result: printing it, keeping it for Excel, or writing it to sink."""
+    if sink is not None:
+        return sink.write
+    if output == "stdout":
+        return lambda result: report.printer(**result)
+    return results.append
+
+
+def scan(domains, args, handle_result):
+    """Scans domains on the engine args asks for and returns the time each domain took."""
+    handle_result = learning_selectors(handle_result)
+    if args.engine in ("async", "udp"):
+        return run_async(
+            domains,
+            process_domain,
+            handle_result,
+            args.max_inflight,
+            multiplex=args.engine == "udp",
+        )
+
+    domain_queue = Queue()
+    durations = []
+
+    for domain in domains:
+        domain_queue.put(domain)
+
+    threads = []
+    for _ in range(min(args.t, len(domains))):
+        thread = threading.Thread(
+            target=worker,
+            args=(domain_queue, print_lock, handle_result, durations),
+        )
+        thread.start()
+        threads.append(thread)
+
+    domain_queue.join()
+
+    for _ in threads:
+        domain_queue.put(None)
+    for thread in threads:
+        thread.join()
+    return durations
+
+
+def configure(args):
+    """Sets up the shared lookup state from the command line, in this process or a --processes worker."""
+    answer_cache.max_entries = args.cache_size
+    throttle.max_qps = args.ns_max_qps
+    throttle.max_inflight = args.ns_max_inflight
+    discovery_latency.percentile = args.hedge_percentile
+    resolver_pool.redirect = args.dns_redirect
+    selector_sweep.selectors = load_selectors(args.dkim_selectors)
+    selector_sweep.max_inflight = args.dkim_max_inflight
+    selector_sweep.exhaustive = args.dkim_all_selectors
+    spf_networks.enabled = args.spf_flatten or bool(args.spf_authorizes)
+    answer_cache.observer = org_lookups if args.group_by_org else None
+    if args.dkim_stats:
+        selector_sweep.load_hits(args.dkim_stats)
+    public_suffixes.path = args.psl
+
+
+def process_counters():
+    """Returns the counters the end-of-scan statistics are printed from."""
+    return {
+        "cache": answer_cache.stats(),
+        "throttle": throttle.stats(),
+        "groups": org_lookups.stats(),
+        "recording": dns_recording.stats(),
+        "dkim_hits": dict(selector_sweep.hits),
+    }
+
+
+process_args = None
+
+
+def init_process(args):
+    """Sets up a --processes worker the way main() sets up this process.
+
+    The per-nameserver limits are split between the workers, as each
+    keeps its own throttle.
+    """
+    global process_args
+    process_args = args
+    configure(args)
+    throttle.max_qps = share(args.ns_max_qps, args.processes)
+    throttle.max_inflight = share(args.ns_max_inflight, args.processes)
+    if args.replay:
+        dns_recording.replay(args.replay)
+    if spf_networks.enabled:
+        spf_networks.journal = []
+
+
+def scan_task(domains):
+    """Scans one task of domains in a --processes worker.
+
+    Returns the results, the time each domain took, how much the
+    worker's counters grew, and the SPF networks it added to its index.
+    """
+    before = process_counters()
+    results = []
+    durations = scan(domains, process_args, results.append)
+    counters = subtract_counters(process_counters(), before)
+    return results, durations, counters, spf_networks.drain()
+
+
+def scan_processes(domains, groups, args, handle_result):
+    """Scans domains on args.processes worker processes, handing every result to handle_result here.
+
+    Returns the time each domain took and the workers' counters, summed.
+    With args.ordered the results are handed over in the order of domains.
+    """
+    durations = []
+    counters = process_counters()
+    del counters["dkim_hits"]
+    outputs = run_processes(
+        scan_task,
+        tasks(domains, groups),
+        args.processes,
+        init_process,
+        (args,),
+        ordered=args.ordered,
+    )
+
+    def task_results():
+        for results, task_durations, task_counters, networks in outputs:
+            yield from results
+            durations.extend(task_durations)
+            add_counters(counters, task_counters)
+            for domain, network_set in networks:
+                spf_networks.add(domain, network_set)
+
+    results = task_results()
+    if args.ordered:
+        results = in_input_order(results, domains)
+    for result in results:
+        handle_result(result)
+    selector_sweep.add_hits(counters.pop("dkim_hits", {}))
+    return durations, counters
+
+
+def reclassify_results(args):
+    """Recomputes the spoofing verdicts of a previous output file, without DNS lookups."""
+    started = time.monotonic()
+    rows = changed = 0
+    results = []
+    file_name = f"{os.path.splitext(args.reclassify)[0]}.reclassified"
+    sink = None
+    if args.o in SINKS:
+        file_name += f".{args.o}"
+        sink = SINKS[args.o](file_name, append=False)
+    handle_result = result_handler(args.o, results, sink)
+    try:
+        for chunk, chunk_changed in reclassify(args.reclassify):
+            rows += len(chunk)
+            changed += chunk_changed
+            if sink is not None:
+                sink.write_frame(chunk)
+                continue
+            for result in chunk.to_dict("records"):
+                handle_result(result)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    if args.o == "xls" and results:
+        file_name += ".xlsx"
+        report.write_to_excel(results, file_name, append=False)
+    if args.o != "stdout" and rows:
+        print(f"Results written to {file_name}")
+    report.print_reclassify_stats(rows, changed, time.monotonic() - started)
+
+
+def redirect_address(value):
+    """Parses HOST[:PORT] (IPv6 as [HOST]:PORT) for --dns-redirect."""
+    host, port = value, 53
+    if value.startswith("["):
+        host, _, rest = value[1:].partition("]")
+        if rest.startswith(":"):
+            port = int(rest[1:])
+    elif value.count(":") == 1:
+        host, port = value.split(":")
+    return host, int(port)
+
+
+def ip_prefix(value):
+    """Parses an IP address or CIDR network for --spf-authorizes."""
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Process domains to gather DNS, SPF, DMARC, and BIMI records."
@@ -84,12 +334,160 @@ def main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-d", type=str, help="Single domain to process.")
     group.add_argument("-iL", type=str, help="File containing a list of domains.")
+    group.add_argument(
+        "--reclassify",
+        type=str,
+        metavar="INPUT",
+        help="Recompute the spoofing verdicts of a previous output (.xlsx, .csv or .jsonl) without DNS lookups",
+    )
     parser.add_argument(
-        "-o", type=str, choices=["stdout", "xls"], default="stdout", help="Output format"
+        "-o",
+        type=str,
+        choices=["stdout", "xls", "jsonl", "csv"],
+        default="stdout",
+        help="Output format; jsonl and csv write each result to output.jsonl or output.csv as soon as it is ready",
     )
     parser.add_argument("-t", type=int, default=4, help="Number of threads")
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["threads", "async", "udp"],
+        default="threads",
+        help="Run lookups on worker threads, as asyncio coroutines, or as coroutines multiplexed over a few UDP sockets",
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=DEFAULT_MAX_INFLIGHT,
+        help="Maximum number of DNS queries in flight with --engine async or udp",
+    )
+    parser.add_argument(
+        "--ns-max-qps",
+        type=float,
+        default=0,
+        help="Maximum queries per second sent to any one nameserver IP (0 for no limit)",
+    )
+    parser.add_argument(
+        "--ns-max-inflight",
+        type=int,
+        default=0,
+        help="Maximum queries in flight to any one nameserver IP (0 for no limit)",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=None,
+        help="Query the next DNS server in parallel once the current one is slower than this latency percentile",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=answer_cache.max_entries,
+        help="Maximum number of DNS answers kept in the shared cache (0 disables it)",
+    )
+    parser.add_argument(
+        "--dkim-selectors",
+        type=str,
+        metavar="FILE",
+        default=DEFAULT_SELECTORS_FILE,
+        help="File of DKIM selectors to probe, one per line, most likely first",
+    )
+    parser.add_argument(
+        "--dkim-max-inflight",
+        type=int,
+        default=selector_sweep.max_inflight,
+        help="Maximum DKIM selector probes in flight for one domain",
+    )
+    parser.add_argument(
+        "--dkim-all-selectors",
+        action="store_true",
+        help="Probe every DKIM selector instead of stopping after the first wave that finds one",
+    )
+    parser.add_argument(
+        "--dkim-stats",
+        type=str,
+        metavar="FILE",
+        default="",
+        help="File keeping how often each DKIM selector was found, to probe the likeliest first across scans (off by default)",
+    )
+    parser.add_argument(
+        "--dns-redirect",
+        type=redirect_address,
+        metavar="HOST[:PORT]",
+        help="Send every DNS query to this server, e.g. python -m modules.synthetic for load testing",
+    )
+    parser.add_argument(
+        "--spf-flatten",
+        action="store_true",
+        help="Expand each SPF record, with its includes, a and mx mechanisms, into the networks it authorizes",
+    )
+    parser.add_argument(
+        "--spf-authorizes",
+        type=ip_prefix,
+        action="append",
+        default=[],
+        metavar="IP[/PREFIX]",
+        help="After the scan, list the domains whose SPF authorizes this address or network (implies --spf-flatten, repeatable)",
+    )
+    parser.add_argument(
+        "--group-by-org",
+        action="store_true",
+        help="Scan one host per organizational domain before the others, so they usually find its DMARC record in the answer cache",
+    )
+    parser.add_argument(
+        "--psl",
+        type=str,
+        metavar="FILE",
+        default=public_suffixes.path,
+        help="Public suffix list to find organizational domains with; tldextract's bundled snapshot is used while FILE does not exist",
+    )
+    parser.add_argument(
+        "--refresh-psl",
+        action="store_true",
+        help="Download the current public suffix list to the --psl file before scanning",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Split the domains across N worker processes, each running its own --engine; --ns-max-qps and --ns-max-inflight are shared between them",
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="With --processes, output results in the order of the input domains instead of as they finish",
+    )
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument(
+        "--record",
+        type=str,
+        metavar="FILE",
+        help="Append every DNS answer the scan receives to FILE",
+    )
+    recording.add_argument(
+        "--replay",
+        type=str,
+        metavar="FILE",
+        help="Answer every DNS lookup from a file written by --record, without using the network",
+    )
 
     args = parser.parse_args()
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+    if args.processes > 1 and args.record:
+        parser.error("--record cannot be used with --processes")
+    configure(args)
+    if args.reclassify:
+        reclassify_results(args)
+        return
+    if args.refresh_psl:
+        size = public_suffixes.refresh()
+        print(f"[+] Public suffix list ({size} bytes) written to {args.psl}")
+    if args.record:
+        dns_recording.record(args.record)
+    elif args.replay and args.processes == 1:
+        dns_recording.replay(args.replay)
 
     if args.d:
         domains = [args.d]
@@ -99,30 +497,42 @@ def main():
         with open(temp_path, "r") as f:
             domains = [line.strip() for line in f if line.strip()]
 
-    domain_queue = Queue()
     results = []
-
-    for domain in domains:
-        domain_queue.put(domain)
-
-    threads = []
-    for _ in range(min(args.t, len(domains))):
-        thread = threading.Thread(
-            target=worker, args=(domain_queue, print_lock, args.o, results)
-        )
-        thread.start()
-        threads.append(thread)
-
-    domain_queue.join()
+    sink = None
+    if args.o in SINKS:
+        sink = SINKS[args.o](f"output.{args.o}")
+    handle_result = result_handler(args.o, results, sink)
+    started = time.monotonic()
+    groups = group_by_org(domains) if args.group_by_org else None
+    try:
+        if args.processes > 1:
+            durations, counters = scan_processes(domains, groups, args, handle_result)
+        else:
+            durations = scan(schedule(groups) if groups else domains, args, handle_result)
+            counters = process_counters()
+    finally:
+        if sink is not None:
+            sink.close()
+    elapsed = time.monotonic() - started
 
     if args.o == "xls" and results:
         report.write_to_excel(results)
         print("Results written to output.xlsx")
+    if sink is not None and sink.rows:
+        print(f"Results written to {sink.file_name}")
 
-    for _ in threads:
-        domain_queue.put(None)
-    for thread in threads:
-        thread.join()
+    dns_recording.close()
+    if args.dkim_stats and not args.replay:
+        selector_sweep.save_hits(args.dkim_stats)
+    for prefix in args.spf_authorizes:
+        report.print_spf_authorizations(prefix, spf_networks.lookup(prefix))
+    report.print_scan_stats(elapsed, durations)
+    report.print_cache_stats(counters["cache"])
+    report.print_throttle_stats(counters["throttle"])
+    if args.group_by_org:
+        report.print_group_stats(len(domains), len(groups), counters["groups"])
+    if args.record or args.replay:
+        report.print_recording_stats(counters["recording"])
 
 
 if __name__ == "__main__":
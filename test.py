@@ -1,5 +1,51 @@
+import time
 import unittest
+from unittest import mock
+
+import dns.resolver
+import dns.rrset
+
+from modules import lookup
+from modules.cache import DNSCache
+from modules.classifier import (
+    DECIDE_ERRORS,
+    classify,
+    classify_frame,
+    decide,
+    decide_invalid,
+    master_table_inputs,
+    spoofability,
+    valid_syntax,
+)
+from modules.dkim import DKIM, SelectorSweep
+from modules.dmarc import DMARC
+from modules.dns import NameserverAddresses
+from modules.engine import run_async
+from modules.groups import OrgLookups, group_by_org, schedule
+from modules.hedge import LatencyTracker, hedge
+from modules.keyinfo import KeyInfo, KeyInfoCache
+from modules.networks import NetworkIndex, NetworkSet
+from modules.pool import ResolverPool, SocketPool, _Resolution
+from modules.processes import (
+    add_counters,
+    in_input_order,
+    run_processes,
+    share,
+    subtract_counters,
+    tasks,
+)
+from modules.psl import PublicSuffixes
+from modules.reclassify import read_results, reclassify
+from modules.recording import DNSRecording
+from modules.sinks import SINKS, CSVSink, JSONLSink
+from modules.spf import SPF
+from modules.spfterms import parse_spf
 from modules.spoofing import Spoofing
+from modules.syntax import validate_record_syntax
+from modules.synthetic import SyntheticZone
+from modules.tags import parse_tags
+from modules.throttle import Throttle
+from modules.udp import UDPMultiplexer
 
 
 class TestSpoofy(unittest.TestCase):
@@ -424,5 +470,1088 @@ class TestSpoofy(unittest.TestCase):
         self.assertEqual(spoofing.spoofable, 0)
 
 
+class TestDKIM(unittest.TestCase):
+    KEY = '"v=DKIM1; k=rsa; p=AAAA"'
+
+    def scan(self, zone, sweep, spf_record=None):
+        queried = []
+
+        def fake_resolve(qname, rdtype, nameservers=None):
+            queried.append(qname)
+            if (qname, rdtype) in zone:
+                if zone[qname, rdtype] is None:
+                    raise dns.resolver.NoAnswer
+                if zone[qname, rdtype] == "timeout":
+                    raise dns.resolver.LifetimeTimeout(timeout=5, errors=[])
+                return dns.rrset.from_text(
+                    qname + ".", 300, "IN", rdtype, zone[qname, rdtype]
+                )
+            raise dns.resolver.NXDOMAIN
+
+        with mock.patch("modules.lookup.resolve", fake_resolve), mock.patch(
+            "modules.dkim.selector_sweep", sweep
+        ):
+            dkim = DKIM("example.com", spf_record=spf_record)
+        sweep.finish(dkim.domain, dkim.selectors, complete=not dkim.failed_probes)
+        return dkim, queried
+
+    def test_missing_domainkey_tree_skips_the_selector_sweep(self):
+        dkim, queried = self.scan({}, SelectorSweep())
+        self.assertIsNone(dkim.dkim_record)
+        self.assertEqual(sorted(queried), ["_domainkey.example.com", "example.com"])
+
+    def test_exhaustive_sweep_reports_every_selector_in_rank_order(self):
+        sweep = SelectorSweep(exhaustive=True)
+        dkim, queried = self.scan(
+            {
+                ("_domainkey.example.com", "TXT"): None,
+                ("s1._domainkey.example.com", "TXT"): self.KEY,
+                ("google._domainkey.example.com", "TXT"): self.KEY,
+                ("mandrill._domainkey.example.com", "TXT"): self.KEY,
+            },
+            sweep,
+        )
+        self.assertEqual(dkim.selector, "google")
+        self.assertEqual(dkim.selectors, ["google", "s1", "mandrill"])
+        self.assertEqual(dkim.algorithm, "rsa")
+        self.assertEqual(len(queried), len(sweep.selectors) + 2)
+        self.assertEqual(sweep.hits, {"google": 1, "s1": 1, "mandrill": 1})
+
+    def test_provider_selectors_are_probed_first(self):
+        dkim, queried = self.scan(
+            {
+                ("_domainkey.example.com", "TXT"): None,
+                ("example.com", "MX"): "10 example-com.mail.protection.outlook.com.",
+                ("s1._domainkey.example.com", "TXT"): self.KEY,
+                ("selector2._domainkey.example.com", "TXT"): self.KEY,
+            },
+            SelectorSweep(),
+            spf_record="v=spf1 include:sendgrid.net -all",
+        )
+        self.assertEqual(dkim.providers, ["Microsoft 365", "SendGrid"])
+        self.assertEqual(dkim.selectors, ["selector2", "s1"])
+        self.assertLess(len(queried), 12)
+
+    def test_failed_probes_are_counted_and_not_learned(self):
+        sweep = SelectorSweep(exhaustive=True)
+        dkim, _ = self.scan(
+            {
+                ("_domainkey.example.com", "TXT"): None,
+                ("s1._domainkey.example.com", "TXT"): self.KEY,
+                ("google._domainkey.example.com", "TXT"): "timeout",
+            },
+            sweep,
+        )
+        self.assertEqual(dkim.selectors, ["s1"])
+        self.assertEqual(dkim.failed_probes, 1)
+        self.assertEqual(sweep.hits, {})
+
+    def test_learned_hits_reorder_the_first_wave(self):
+        import os
+        import tempfile
+
+        sweep = SelectorSweep(["a", "b", "c", "d"], first_wave=1)
+        self.assertEqual(sweep.waves(), [["a"], ["b", "c", "d"]])
+        sweep.learn(["c", "c", "d"])
+
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        sweep.save_hits(path)
+        loaded = SelectorSweep(["a", "b", "c", "d"], first_wave=1)
+        loaded.load_hits(path)
+        self.assertEqual(loaded.waves(), [["c"], ["d", "a", "b"]])
+
+    def test_order_is_pinned_until_the_domain_finishes(self):
+        sweep = SelectorSweep(["a", "b", "c"], first_wave=1)
+        self.assertEqual(sweep.waves(domain="example.com"), [["a"], ["b", "c"]])
+        sweep.finish("other.com", ["c"])
+        self.assertEqual(sweep.waves(domain="example.com"), [["a"], ["b", "c"]])
+        self.assertEqual(sweep.waves(), [["c"], ["a", "b"]])
+        sweep.finish("example.com", ["b"], complete=False)
+        self.assertEqual(sweep.hits, {"c": 1})
+        self.assertEqual(sweep.waves(domain="example.com"), [["c"], ["a", "b"]])
+
+
+class TestSPF(unittest.TestCase):
+    def scan(self, zone, domains):
+        queried = []
+
+        def fake_resolve(qname, rdtype, nameservers=None):
+            queried.append(qname)
+            if qname not in zone:
+                raise dns.resolver.NXDOMAIN
+            return dns.rrset.from_text(qname + ".", 300, "IN", "TXT", zone[qname])
+
+        with mock.patch("modules.lookup.resolve", fake_resolve), mock.patch(
+            "modules.spf.resolve", fake_resolve
+        ), mock.patch("modules.spf.spf_tree_cache", DNSCache()):
+            results = [SPF(domain) for domain in domains]
+        return results, queried
+
+    def test_shared_include_is_walked_once(self):
+        zone = {
+            "a.com": '"v=spf1 include:_spf.esp.net -all"',
+            "b.com": '"v=spf1 mx include:_spf.esp.net ~all"',
+            "_spf.esp.net": '"v=spf1 a include:_spf2.esp.net ~all"',
+            "_spf2.esp.net": '"v=spf1 ip4:192.0.2.0/24 -all"',
+        }
+        (a, b), queried = self.scan(zone, ["a.com", "b.com"])
+        self.assertEqual((a.all_mechanism, a.spf_dns_query_count), ("-all", 3))
+        self.assertEqual((b.all_mechanism, b.spf_dns_query_count), ("~all", 4))
+        self.assertEqual(queried.count("_spf.esp.net"), 1)
+        self.assertEqual(queried.count("_spf2.esp.net"), 1)
+
+    def test_redirect_supplies_the_all_mechanism_and_loops_are_permerrors(self):
+        zone = {
+            "a.com": '"v=spf1 redirect=_spf.a.com"',
+            "_spf.a.com": '"v=spf1 include:a.com -all"',
+        }
+        (a,), _ = self.scan(zone, ["a.com"])
+        self.assertEqual(a.all_mechanism, "-all")
+        self.assertEqual(a.permerror, "include loop at a.com")
+        self.assertTrue(a.too_many_dns_queries)
+
+    def test_walk_stops_once_a_limit_is_exceeded(self):
+        zone = {
+            f"_spf{i}.a.com": f'"v=spf1 include:_spf{i + 1}.a.com -all"'
+            for i in range(30)
+        }
+        zone["a.com"] = '"v=spf1 include:_spf0.a.com -all"'
+        zone["b.com"] = '"v=spf1 include:x.b.com include:y.b.com include:z.b.com -all"'
+        (a, b), queried = self.scan(zone, ["a.com", "b.com"])
+        self.assertEqual(a.permerror, "more than 10 DNS lookups at _spf9.a.com")
+        self.assertEqual(a.spf_dns_query_count, 11)
+        self.assertNotIn("_spf10.a.com", queried)
+        self.assertEqual(b.permerror, "more than 2 void lookups at z.b.com")
+        self.assertEqual(b.spf_dns_query_count, 3)
+
+    def test_redirect_all_is_kept_past_the_lookup_limit(self):
+        zone = {
+            f"_spf{i}.a.com": f'"v=spf1 redirect=_spf{i + 1}.a.com"' for i in range(12)
+        }
+        zone["_spf12.a.com"] = '"v=spf1 ?all"'
+        zone["a.com"] = '"v=spf1 redirect=_spf0.a.com"'
+        includes = " ".join(f"include:_i{i}.b.com" for i in range(11))
+        zone["b.com"] = f'"v=spf1 {includes} redirect=_spf.b.com"'
+        zone["_spf.b.com"] = '"v=spf1 -all -all"'
+        (a, b), _ = self.scan(zone, ["a.com", "b.com"])
+        self.assertEqual(a.permerror, "more than 10 DNS lookups at _spf9.a.com")
+        self.assertEqual(a.all_mechanism, "?all")
+        self.assertEqual(b.permerror, "more than 10 DNS lookups at b.com")
+        self.assertEqual(b.all_mechanism, "2many")
+
+    def test_flattening_expands_includes_a_and_mx(self):
+        records = {
+            ("a.com", "TXT"): '"v=spf1 a/31 mx include:_spf.esp.net -ip4:10.0.0.0/8 -all"',
+            ("a.com", "A"): "192.0.2.1",
+            ("a.com", "MX"): "10 mx.a.com.",
+            ("mx.a.com", "AAAA"): "2001:db8::25",
+            ("_spf.esp.net", "TXT"): '"v=spf1 ip4:198.51.100.0/25 ip4:198.51.100.128/25 ~all"',
+        }
+
+        def fake_resolve(qname, rdtype, nameservers=None):
+            if (qname, rdtype) not in records:
+                raise dns.resolver.NoAnswer
+            return dns.rrset.from_text(
+                qname + ".", 300, "IN", rdtype, records[qname, rdtype]
+            )
+
+        with mock.patch("modules.lookup.resolve", fake_resolve), mock.patch(
+            "modules.spf.resolve", fake_resolve
+        ), mock.patch("modules.spf.spf_tree_cache", DNSCache()):
+            networks = SPF("a.com").get_spf_networks()
+        self.assertEqual(
+            [str(network) for network in networks.networks()],
+            ["192.0.2.0/31", "198.51.100.0/24", "2001:db8::25/128"],
+        )
+        self.assertNotIn("10.0.0.1", networks)
+
+        index = NetworkIndex()
+        index.add("a.com", networks)
+        index.add("b.com", NetworkSet(["198.51.100.0/26"]))
+        self.assertEqual(index.lookup("198.51.100.7"), ["a.com", "b.com"])
+        self.assertEqual(index.lookup("198.51.100.0/25"), ["a.com"])
+        self.assertEqual(index.lookup("2001:db8::25"), ["a.com"])
+        self.assertEqual(index.lookup("192.0.2.2"), [])
+
+    def test_flattening_skips_failing_includes_and_ignored_redirects(self):
+        records = {
+            ("a.com", "TXT"): (
+                '"v=spf1 +include:pass.net -include:fail.net ~include:soft.net '
+                'include:plain.net ?include:neutral.net redirect=ignored.net -all"'
+            ),
+            ("b.com", "TXT"): '"v=spf1 ip4:192.0.2.1 redirect=used.net"',
+            ("pass.net", "TXT"): '"v=spf1 ip4:198.51.100.1 -all"',
+            ("plain.net", "TXT"): '"v=spf1 ip4:198.51.100.2 -all"',
+            ("fail.net", "TXT"): '"v=spf1 ip4:203.0.113.1 -all"',
+            ("soft.net", "TXT"): '"v=spf1 ip4:203.0.113.2 -all"',
+            ("neutral.net", "TXT"): '"v=spf1 ip4:203.0.113.3 -all"',
+            ("ignored.net", "TXT"): '"v=spf1 ip4:203.0.113.4 -all"',
+            ("used.net", "TXT"): '"v=spf1 ip4:198.51.100.3 -all"',
+        }
+
+        def fake_resolve(qname, rdtype, nameservers=None):
+            if (qname, rdtype) not in records:
+                raise dns.resolver.NoAnswer
+            return dns.rrset.from_text(
+                qname + ".", 300, "IN", rdtype, records[qname, rdtype]
+            )
+
+        with mock.patch("modules.lookup.resolve", fake_resolve), mock.patch(
+            "modules.spf.resolve", fake_resolve
+        ), mock.patch("modules.spf.spf_tree_cache", DNSCache()):
+            networks = {domain: SPF(domain).get_spf_networks() for domain in ("a.com", "b.com")}
+        self.assertEqual(
+            [str(network) for network in networks["a.com"].networks()],
+            ["198.51.100.1/32", "198.51.100.2/32"],
+        )
+        self.assertEqual(
+            [str(network) for network in networks["b.com"].networks()],
+            ["192.0.2.1/32", "198.51.100.3/32"],
+        )
+
+
+class TestSPFTerms(unittest.TestCase):
+    def test_terms_are_typed_and_counted_once(self):
+        parsed = parse_spf(
+            "v=spf1 +a/24//64 -mx:mail.example.com ptr exists:%{i}.example.com "
+            "ip6:2001:db8::/32 ~include:_spf.example.net redirect=_spf.example.com"
+        )
+        a, mx, _, _, ip6, include, redirect = parsed.terms
+        self.assertEqual((a.qualifier, a.name, a.cidr, a.cidr6), ("+", "a", 24, 64))
+        self.assertEqual((mx.name, mx.value, mx.passes), ("mx", "mail.example.com", False))
+        self.assertEqual((ip6.value, ip6.cidr), ("2001:db8::", 32))
+        self.assertEqual(
+            (include.qualifier, include.value, include.passes),
+            ("~", "_spf.example.net", False),
+        )
+        self.assertTrue(redirect.modifier)
+        self.assertEqual(parsed.lookups, 6)
+        self.assertEqual(parsed.targets, ("_spf.example.net", "_spf.example.com"))
+        self.assertEqual(parsed.redirect, "_spf.example.com")
+        self.assertIsNone(parsed.all_mechanism)
+        self.assertIs(parse_spf("v=spf1 all"), parse_spf("v=spf1 all"))
+        self.assertEqual(parse_spf("v=spf1 all").all_mechanism, "+all")
+        self.assertEqual(parse_spf("v=spf1 -all ?all").all_mechanism, "2many")
+
+    def test_syntax_validation_reads_the_terms(self):
+        valid = [
+            "v=spf1 ip4:192.0.2.0/24 a/28 mx:mail.example.com -all",
+            "v=spf1 ~include:_spf.example.com redirect=_spf.example.com",
+        ]
+        invalid = [
+            "v=spf2 -all",
+            "v=spf1 include: -all",
+            "v=spf1 ip4:192.0.2.0/33",
+            "v=spf1 -redirect=_spf.example.com",
+            "v=spf1 all:example.com",
+            "v=spf1 foo=bar",
+        ]
+        for record in valid:
+            self.assertTrue(validate_record_syntax(record, "SPF"), record)
+        for record in invalid:
+            self.assertFalse(validate_record_syntax(record, "SPF"), record)
+
+
+class TestTags(unittest.TestCase):
+    def test_tags_are_matched_by_their_own_name(self):
+        tags = parse_tags("v=DMARC1; sp=none ; p = reject;pct=50; p=none; rua")
+        self.assertEqual(tags, {"v": "DMARC1", "sp": "none", "p": "reject", "pct": "50"})
+        self.assertEqual(parse_tags(None), {})
+
+    def test_dmarc_reads_policy_after_subdomain_policy(self):
+        record = '"v=DMARC1; sp=none; p=reject; fo=0:1; ruf=mailto:f@example.com"'
+
+        def fake_resolve(qname, rdtype, nameservers=None):
+            return dns.rrset.from_text(qname + ".", 300, "IN", "TXT", record)
+
+        with mock.patch("modules.dmarc.resolve", fake_resolve):
+            dmarc = DMARC("example.com")
+        self.assertEqual((dmarc.policy, dmarc.sp), ("reject", "none"))
+        self.assertEqual(dmarc.fo, "mailto:f@example.com")
+
+
+class TestPublicSuffixes(unittest.TestCase):
+    def test_snapshot_is_used_until_a_refresh_pins_a_list(self):
+        import os
+        import pathlib
+        import shutil
+        import tempfile
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, "source.dat")
+        with open(source, "w") as f:
+            f.write("// ===BEGIN ICANN DOMAINS===\ncom\nbench.test\n")
+
+        suffixes = PublicSuffixes(os.path.join(directory, "psl.dat"))
+        self.assertEqual(
+            suffixes.registered_domain("mail.example.co.uk"), "example.co.uk"
+        )
+        self.assertTrue(suffixes.is_subdomain("mail.example.co.uk"))
+        self.assertIs(suffixes.extract("a.b.com"), suffixes.extract("a.b.com"))
+
+        suffixes.refresh(pathlib.Path(source).as_uri())
+        self.assertEqual(
+            suffixes.registered_domain("mail.org.bench.test"), "org.bench.test"
+        )
+        pinned = PublicSuffixes(suffixes.path)
+        self.assertEqual(pinned.registered_domain("a.b.bench.test"), "b.bench.test")
+
+
+class TestClassifier(unittest.TestCase):
+    def test_table_matches_the_decision_tree_exhaustively(self):
+        import itertools
+
+        values = (
+            (None, 0, 100, "100", 50, "abc"),
+            (None, "", "v=spf1 -all"),
+            (0, 10, 11, None),
+            (None, "", "-all", "?all", "+all", "~all", "2many", "all"),
+            (None, "", "none", "quarantine", "reject"),
+            (None, "none", "quarantine", "reject", "x"),
+            (None, "r", "s", "x"),
+            (None, "", "v=DMARC1; p=none"),
+        )
+        rows = list(itertools.product(*values))
+        expected = []
+        for row in rows:
+            try:
+                expected.append(decide(*row))
+            except DECIDE_ERRORS:
+                expected.append(
+                    decide_invalid(
+                        valid_syntax(row[1], "SPF"),
+                        valid_syntax(row[7], "DMARC"),
+                        row[4] == "none",
+                    )
+                )
+        self.assertEqual(classify(*zip(*rows)).tolist(), expected)
+        for row, code in list(zip(rows, expected))[::97]:
+            self.assertEqual(spoofability(*row), code)
+
+    def test_master_table(self):
+        rows = list(master_table_inputs("files/Master_Table.xlsx"))
+        codes = classify(*zip(*(arguments for _, _, _, arguments in rows)))
+        differ = [row for row, code in zip(rows, codes) if row[2] != code]
+        # The tree's verdicts are kept where the workbook has since diverged;
+        # python -m modules.classifier lists these rows.
+        self.assertEqual(len(rows), 198)
+        self.assertEqual(len(differ), 34)
+
+    def test_frame_reads_missing_cells_as_none(self):
+        import pandas as pd
+
+        frame = pd.DataFrame(
+            {
+                "DMARC_PCT": [100.0, float("nan"), 50.0],
+                "SPF": ["v=spf1 -all", "v=spf1 ~all", float("nan")],
+                "SPF_NUM_DNS_QUERIES": [0, 1, float("nan")],
+                "SPF_MULTIPLE_ALLS": ["-all", "~all", float("nan")],
+                "DMARC_POLICY": ["none", "reject", float("nan")],
+                "DMARC_SP": ["none", float("nan"), float("nan")],
+                "DMARC_ASPF": ["r", float("nan"), float("nan")],
+                "DMARC": ["v=DMARC1; p=none; sp=none; aspf=r", "v=DMARC1; p=reject", None],
+            }
+        )
+        self.assertEqual(classify_frame(frame).tolist(), [1, 8, 3])
+
+
+class TestReclassify(unittest.TestCase):
+    def test_rescores_stored_rows_in_chunks(self):
+        import os
+        import shutil
+        import tempfile
+
+        import pandas as pd
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        rows = [
+            {
+                "DOMAIN": "a.com",
+                "SPF": "v=spf1 -all",
+                "SPF_MULTIPLE_ALLS": "-all",
+                "SPF_NUM_DNS_QUERIES": 0,
+                "DMARC": None,
+                "DMARC_POLICY": None,
+                "DMARC_PCT": None,
+                "DMARC_ASPF": None,
+                "DMARC_SP": None,
+                "DKIM_KEY_LENGTH": 1024,
+                "SPOOFING_POSSIBLE": False,
+                "SPOOFING_TYPE": "Spoofing is not possible for a.com.",
+            },
+            {
+                "DOMAIN": "b.com",
+                "SPF": "v=spf1 ~all",
+                "SPF_MULTIPLE_ALLS": "~all",
+                "SPF_NUM_DNS_QUERIES": 1,
+                "DMARC": "v=DMARC1; p=reject",
+                "DMARC_POLICY": "reject",
+                "DMARC_PCT": None,
+                "DMARC_ASPF": None,
+                "DMARC_SP": None,
+                "DKIM_KEY_LENGTH": None,
+                "SPOOFING_POSSIBLE": False,
+                "SPOOFING_TYPE": "Spoofing is not possible for b.com.",
+            },
+        ]
+        csv_path = os.path.join(directory, "scan.csv")
+        jsonl_path = os.path.join(directory, "scan.jsonl")
+        pd.DataFrame(rows, dtype=object).to_csv(csv_path, index=False)
+        pd.DataFrame(rows, dtype=object).to_json(
+            jsonl_path, orient="records", lines=True
+        )
+
+        for path in (csv_path, jsonl_path):
+            chunks = list(reclassify(path, chunk_size=1))
+            self.assertEqual([changed for _, changed in chunks], [1, 0])
+            first = chunks[0][0].iloc[0]
+            self.assertIs(first["SPOOFING_POSSIBLE"], True)
+            self.assertEqual(first["SPOOFING_TYPE"], "Spoofing possible for a.com.")
+            self.assertTrue(pd.isna(first["DMARC"]))
+
+            extension = os.path.splitext(path)[1][1:]
+            output = os.path.join(directory, f"reclassified.{extension}")
+            sink = SINKS[extension](output, append=False)
+            for chunk, _ in reclassify(path):
+                sink.write_frame(chunk)
+            sink.close()
+            written = next(read_results(output))
+            stored = next(read_results(path))
+            unchanged = [c for c in stored.columns if not c.startswith("SPOOFING_")]
+            pd.testing.assert_frame_equal(written[unchanged], stored[unchanged])
+            with open(output) as f:
+                self.assertNotIn("1024.0", f.read())
+
+        pd.DataFrame(rows).drop(columns=["DMARC_SP"]).to_csv(csv_path, index=False)
+        with self.assertRaises(ValueError):
+            list(reclassify(csv_path))
+
+
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_rows_reach_the_file_before_close(self):
+        import json
+        import os
+
+        path = os.path.join(self.directory, "output.jsonl")
+        sink = JSONLSink(path, flush_rows=2)
+        sink.write({"DOMAIN": "a.com", "SPF": None})
+        sink.write({"DOMAIN": "b.com", "SPF": "v=spf1 -all"})
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows[1], {"DOMAIN": "b.com", "SPF": "v=spf1 -all"})
+        self.assertEqual(list(rows[0]), ["DOMAIN", "SPF"])
+        sink.close()
+
+    def test_csv_appends_under_the_existing_header(self):
+        import os
+
+        import pandas as pd
+
+        path = os.path.join(self.directory, "output.csv")
+        sink = CSVSink(path)
+        sink.write({"DOMAIN": "a.com", "SPF": None, "DMARC": "v=DMARC1; p=none"})
+        sink.close()
+        sink = CSVSink(path)
+        sink.write_frame(pd.DataFrame([{"DMARC": None, "DOMAIN": "b.com"}]))
+        with self.assertRaises(ValueError):
+            sink.write({"DOMAIN": "c.com", "DKIM": None})
+        sink.close()
+        frame = pd.read_csv(path)
+        self.assertEqual(list(frame.columns), ["DOMAIN", "SPF", "DMARC"])
+        self.assertEqual(list(frame["DOMAIN"]), ["a.com", "b.com"])
+
+
+class TestProcesses(unittest.TestCase):
+    def test_tasks_keep_organizations_together(self):
+        domains = ["a.com", "www.a.com", "b.com", "mail.b.com", "c.com"]
+        self.assertEqual(
+            list(tasks(domains, chunk_size=2)),
+            [["a.com", "www.a.com"], ["b.com", "mail.b.com"], ["c.com"]],
+        )
+        groups = group_by_org(["www.a.com", "b.com", "a.com", "mail.b.com"])
+        self.assertEqual(
+            list(tasks(domains, groups, chunk_size=2)),
+            [["a.com", "www.a.com"], ["b.com", "mail.b.com"]],
+        )
+
+    def test_counters_are_summed_from_worker_deltas(self):
+        before = {"cache": {"hits": 2, "entries": 5}, "dkim_hits": {"s1": 1}}
+        after = {"cache": {"hits": 7, "entries": 9}, "dkim_hits": {"s1": 1, "s2": 3}}
+        delta = subtract_counters(after, before)
+        self.assertEqual(
+            delta, {"cache": {"hits": 5, "entries": 4}, "dkim_hits": {"s1": 0, "s2": 3}}
+        )
+        totals = add_counters({"cache": {"hits": 1}}, delta)
+        self.assertEqual(totals["cache"], {"hits": 6, "entries": 4})
+
+    def test_pool_returns_outputs_in_task_order(self):
+        outputs = run_processes(len, [[1], [1, 2], [1, 2, 3]], 2, None, ordered=True)
+        self.assertEqual(list(outputs), [1, 2, 3])
+
+    def test_results_are_put_back_in_input_order(self):
+        domains = ["www.a.com", "b.com", "a.com", "b.com"]
+        finished = ["a.com", "b.com", "www.a.com", "b.com"]
+        results = [{"DOMAIN": domain, "n": n} for n, domain in enumerate(finished)]
+        ordered = list(in_input_order(iter(results), domains))
+        self.assertEqual(
+            [(r["DOMAIN"], r["n"]) for r in ordered],
+            [("www.a.com", 2), ("b.com", 1), ("a.com", 0), ("b.com", 3)],
+        )
+
+    def test_nameserver_limits_are_shared_between_workers(self):
+        self.assertEqual(share(100.0, 4), 25.0)
+        self.assertEqual(share(10, 4), 2)
+        self.assertEqual(share(2, 4), 1)
+        self.assertEqual(share(0, 4), 0)
+
+    def test_network_journal_is_handed_back(self):
+        index = NetworkIndex()
+        index.add("a.com", NetworkSet(["192.0.2.0/24"]))
+        self.assertEqual(index.drain(), [])
+        index.journal = []
+        network_set = NetworkSet(["198.51.100.0/24"])
+        index.add("b.com", network_set)
+        self.assertEqual(index.drain(), [("b.com", network_set)])
+        self.assertEqual(index.drain(), [])
+
+
+class TestGroups(unittest.TestCase):
+    def test_org_domain_leads_and_other_hosts_follow(self):
+        groups = group_by_org(
+            ["www.example.com", "example.com", "mail.example.co.uk", "other.org"]
+        )
+        self.assertEqual(
+            groups,
+            {
+                "example.com": ["www.example.com", "example.com"],
+                "example.co.uk": ["mail.example.co.uk"],
+                "other.org": ["other.org"],
+            },
+        )
+        self.assertEqual(
+            schedule(groups),
+            ["example.com", "mail.example.co.uk", "other.org", "www.example.com"],
+        )
+        self.assertEqual(schedule(group_by_org(["a.com", "b.com"])), ["a.com", "b.com"])
+
+    def test_hosts_of_one_organization_are_spread_apart(self):
+        groups = group_by_org(["a.com", "www.a.com", "mail.a.com", "www.b.com", "b.com"])
+        self.assertEqual(
+            schedule(groups), ["a.com", "b.com", "www.a.com", "www.b.com", "mail.a.com"]
+        )
+
+    def test_organization_dmarc_lookups_sent_are_counted(self):
+        cache = DNSCache()
+        cache.observer = lookups = OrgLookups()
+        for qname in ("_dmarc.example.com", "_dmarc.www.example.com", "example.com"):
+            cache.put(cache.make_key(qname, "TXT"), dns.resolver.NoAnswer, 60)
+        # Two hosts asking before the first answer was in: one repeat.
+        cache.put(cache.make_key("_dmarc.example.com", "TXT"), dns.resolver.NoAnswer, 60)
+        cache.put(cache.make_key("_dmarc.other.com", "TXT"), dns.resolver.NoAnswer, 0)
+        for _ in ("www.example.com", "mail.example.com"):
+            cache.get(cache.make_key("_dmarc.example.com", "TXT"))
+        self.assertEqual(lookups.stats(), {"sent": 3, "distinct": 2})
+
+
+class TestKeyInfo(unittest.TestCase):
+    def test_matches_cryptography_and_memoizes_by_fingerprint(self):
+        import hashlib
+
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa, x25519
+
+        spki = serialization.PublicFormat.SubjectPublicKeyInfo
+        der = serialization.Encoding.DER
+        cache = KeyInfoCache(max_entries=2)
+        keys = [
+            rsa.generate_private_key(65537, 1025).public_key(),
+            ec.generate_private_key(ec.SECP384R1()).public_key(),
+            ed25519.Ed25519PrivateKey.generate().public_key(),
+        ]
+        expected = [("rsa", 1025, None), ("ec", 384, "secp384r1"), ("ed25519", 256, None)]
+        for key, (key_type, bits, curve) in zip(keys, expected):
+            data = key.public_bytes(der, spki)
+            fingerprint = hashlib.sha256(data).hexdigest()
+            self.assertEqual(cache.get(data), KeyInfo(key_type, bits, curve, fingerprint))
+
+        pkcs1 = keys[0].public_bytes(der, serialization.PublicFormat.PKCS1)
+        self.assertEqual(cache.get(pkcs1).bits, 1025)
+        self.assertEqual(cache.get(bytes(32)).key_type, "ed25519")
+        self.assertIsNone(cache.get(b"not a key"))
+        unsupported = x25519.X25519PrivateKey.generate().public_key()
+        self.assertIsNone(cache.get(unsupported.public_bytes(der, spki)))
+        cache.get(bytes(32))
+        self.assertEqual((cache.hits, len(cache._entries)), (1, 2))
+
+
+class TestDNSCache(unittest.TestCase):
+    def setUp(self):
+        self.rrset = dns.rrset.from_text(
+            "example.com.", 300, "IN", "TXT", '"v=spf1 -all"'
+        )
+
+    def test_key_ignores_case_and_trailing_dot(self):
+        self.assertEqual(
+            DNSCache.make_key("Example.COM.", "txt", ["1.1.1.1"]),
+            DNSCache.make_key("example.com", "TXT", ("1.1.1.1",)),
+        )
+
+    def test_hit_and_miss_counters(self):
+        cache = DNSCache()
+        key = cache.make_key("example.com", "TXT", ["1.1.1.1"])
+        self.assertIsNone(cache.get(key))
+        cache.put(key, self.rrset, self.rrset.ttl)
+        self.assertIs(cache.get(key), self.rrset)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = DNSCache()
+        key = cache.make_key("example.com", "TXT")
+        with mock.patch("modules.cache.time.monotonic", return_value=1000.0):
+            cache.put(key, self.rrset, 300)
+        with mock.patch("modules.cache.time.monotonic", return_value=1301.0):
+            self.assertIsNone(cache.get(key))
+        self.assertEqual(len(cache), 0)
+
+    def test_negative_answer(self):
+        cache = DNSCache()
+        key = cache.make_key("nope.example.com", "TXT")
+        cache.put(key, dns.resolver.NXDOMAIN, 60)
+        self.assertIs(cache.get(key), dns.resolver.NXDOMAIN)
+        self.assertEqual(cache.stats()["negative_hits"], 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = DNSCache(max_entries=2)
+        for name in ["a.com", "b.com"]:
+            cache.put(cache.make_key(name, "TXT"), self.rrset, 300)
+        cache.get(cache.make_key("a.com", "TXT"))
+        cache.put(cache.make_key("c.com", "TXT"), self.rrset, 300)
+        self.assertIsNone(cache.get(cache.make_key("b.com", "TXT")))
+        self.assertIsNotNone(cache.get(cache.make_key("a.com", "TXT")))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class TestResolverPool(unittest.TestCase):
+    def test_resolvers_are_reused_per_nameserver_list(self):
+        pool = ResolverPool()
+        resolver = pool.get(["192.0.2.1", "192.0.2.2"])
+        self.assertIs(pool.get(("192.0.2.1", "192.0.2.2")), resolver)
+        self.assertIsNot(pool.get(["192.0.2.2"]), resolver)
+        self.assertIs(pool.get(["192.0.2.2"]).sockets, resolver.sockets)
+
+    def test_invalid_nameserver_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ResolverPool().get([None, "1.1.1.1"])
+
+    def test_socket_is_rotated_after_max_queries(self):
+        sockets = SocketPool(max_queries=2)
+        first = sockets.get(2)
+        self.assertIs(sockets.get(2), first)
+        self.assertIsNot(sockets.get(2), first)
+        self.assertEqual(first.fileno(), -1)
+        sockets.discard(2)
+
+
+class TestNameserverAddresses(unittest.TestCase):
+    def test_falls_back_to_aaaa_and_resolves_each_host_once(self):
+        calls = []
+
+        def fake_resolve(host, rdtype):
+            calls.append((host, rdtype))
+            if rdtype == "A":
+                raise dns.resolver.NoAnswer()
+            return dns.rrset.from_text(host + ".", 300, "IN", "AAAA", "2001:db8::53")
+
+        addresses = NameserverAddresses()
+        with mock.patch("modules.dns.resolve", fake_resolve):
+            self.assertEqual(addresses.get("NS1.Example.NET."), ["2001:db8::53"])
+            self.assertEqual(addresses.get("ns1.example.net"), ["2001:db8::53"])
+        self.assertEqual(
+            calls, [("ns1.example.net", "A"), ("ns1.example.net", "AAAA")]
+        )
+
+
+class TestThrottle(unittest.TestCase):
+    @mock.patch("modules.throttle.time.monotonic", return_value=100.0)
+    def test_qps_limit_spaces_out_queries_per_nameserver(self, _):
+        throttle = Throttle(max_qps=4)
+        delays = [throttle.reserve("192.0.2.1") for _ in range(3)]
+        self.assertEqual(delays, [0, 0.25, 0.5])
+        self.assertEqual(throttle.reserve("192.0.2.2"), 0)
+        self.assertEqual(throttle.stats()["throttled"], 2)
+
+    def test_backoff_doubles_until_a_good_answer(self):
+        throttle = Throttle(max_inflight=8, backoff=0.5)
+        with mock.patch("modules.throttle.time.monotonic", return_value=100.0):
+            throttle.penalize("192.0.2.1")
+            self.assertEqual(throttle.reserve("192.0.2.1"), 0.5)
+            throttle.penalize("192.0.2.1")
+            self.assertEqual(throttle.reserve("192.0.2.1"), 1.0)
+            self.assertEqual(throttle.reserve("192.0.2.1"), 1.0)
+            throttle.reward("192.0.2.1")
+            self.assertEqual(throttle.reserve("192.0.2.1"), 0)
+        with mock.patch("modules.throttle.time.monotonic", return_value=200.0):
+            throttle.penalize("192.0.2.1")
+            self.assertEqual(throttle.reserve("192.0.2.1"), 0.5)
+        self.assertEqual(throttle.stats()["backoffs"], 3)
+
+    @mock.patch("modules.throttle.time.monotonic", return_value=100.0)
+    def test_no_backoff_or_delay_without_limits(self, _):
+        throttle = Throttle()
+        throttle.penalize("192.0.2.1")
+        self.assertEqual([throttle.reserve("192.0.2.1") for _ in range(3)], [0, 0, 0])
+        self.assertEqual(
+            throttle.stats(), {"throttled": 0, "backoffs": 0, "failed": 0}
+        )
+
+    def test_a_query_is_sent_before_the_lifetime_can_run_out(self):
+        resolver = mock.Mock(nameservers=["192.0.2.1"], families=[2])
+        resolver.timeout, resolver.lifetime = 2.0, 5.0
+        resolution = _Resolution(resolver, "example.com", "TXT")
+        with mock.patch("modules.pool.throttle") as throttle:
+            throttle.reserve.return_value = 8.0
+            server, timeout, delay = resolution.next_attempt()
+            self.assertEqual(server, ("192.0.2.1", 2))
+            self.assertAlmostEqual(delay, 3.0, places=2)
+            self.assertAlmostEqual(timeout, 2.0, places=2)
+            resolution.servers.append(server)
+            resolution.deadline = time.monotonic()
+            with self.assertRaises(dns.resolver.LifetimeTimeout):
+                resolution.next_attempt()
+            self.assertEqual(throttle.record_failure.call_count, 1)
+
+    def test_inflight_limit_works_across_event_loops(self):
+        import asyncio
+
+        throttle = Throttle(max_inflight=1)
+
+        async def query(inflight):
+            async with throttle.inflight_async("192.0.2.1"):
+                inflight.append(1)
+                peak = len(inflight)
+                await asyncio.sleep(0.01)
+                inflight.pop()
+                return peak
+
+        async def wave():
+            inflight = []
+            return await asyncio.gather(*(query(inflight) for _ in range(3)))
+
+        for _ in range(2):
+            self.assertEqual(asyncio.run(wave()), [1, 1, 1])
+
+
+class TestHedge(unittest.TestCase):
+    @staticmethod
+    def evaluate(server):
+        if server == "slow":
+            time.sleep(0.5)
+        return server != "empty", f"records from {server}"
+
+    def test_without_hedging_candidates_run_in_order(self):
+        winner, records = hedge(["slow", "fast"], self.evaluate, LatencyTracker())
+        self.assertEqual((winner, records), ("slow", "records from slow"))
+
+    def test_slow_candidate_is_hedged_with_the_next_one(self):
+        tracker = LatencyTracker(percentile=90, initial_delay=0.05)
+        winner, records = hedge(["slow", "fast"], self.evaluate, tracker)
+        self.assertEqual((winner, records), ("fast", "records from fast"))
+        self.assertEqual(tracker.wins, {1: 1})
+
+    def test_invalid_answer_starts_the_next_candidate_at_once(self):
+        tracker = LatencyTracker(percentile=90, initial_delay=0.3)
+        winner, records = hedge(["slow", "empty", "fast"], self.evaluate, tracker)
+        self.assertEqual((winner, records), ("fast", "records from fast"))
+        self.assertEqual(tracker.wins, {2: 1})
+
+    def test_no_valid_candidate_returns_every_result(self):
+        tracker = LatencyTracker(percentile=90, initial_delay=0.05)
+        winner, records = hedge(["empty"], self.evaluate, tracker)
+        self.assertIsNone(winner)
+        self.assertEqual(records, {"empty": "records from empty"})
+
+
+class TestAsyncScanner(unittest.TestCase):
+    def test_only_dns_and_socket_errors_count_as_failed_lookups(self):
+        def fake_resolve(qname, rdtype, nameservers=None):
+            if qname == "bug.example.com":
+                raise RuntimeError("bug")
+            raise dns.resolver.NoNameservers()
+
+        with mock.patch("modules.lookup.resolve", fake_resolve):
+            results = lookup.resolve_all([("a.example.com", "TXT", None)], 1)
+            self.assertIsInstance(results[0], dns.resolver.NoNameservers)
+            with self.assertRaises(RuntimeError):
+                lookup.resolve_all([("bug.example.com", "TXT", None)], 1)
+
+    def test_resolve_all_hands_missing_lookups_over_in_batches(self):
+        lookups = [(f"s{i}._domainkey.example.com", "TXT", None) for i in range(5)]
+        answers = lookup.PrefetchedAnswers()
+        with lookup.prefetched_answers(answers):
+            with self.assertRaises(lookup.PendingLookups) as raised:
+                lookup.resolve_all(lookups, 3)
+            self.assertEqual(raised.exception.lookups, lookups[:3])
+            for qname, rdtype, nameservers in lookups:
+                answers[lookup.answer_cache.make_key(qname, rdtype, nameservers)] = (
+                    dns.resolver.NXDOMAIN
+                )
+            results = lookup.resolve_all(lookups, 3)
+        self.assertTrue(all(isinstance(r, dns.resolver.NXDOMAIN) for r in results))
+
+    def test_reruns_until_every_lookup_is_fetched(self):
+        zone = {
+            "example.com": '"v=spf1 include:_spf.example.net -all"',
+            "_spf.example.net": '"v=spf1 ip4:192.0.2.0/24 -all"',
+        }
+        fetched = []
+
+        async def fake_fetch(qname, rdtype, nameservers, limit):
+            fetched.append(qname)
+            if qname not in zone:
+                return dns.resolver.NXDOMAIN
+            return dns.rrset.from_text(qname + ".", 300, "IN", rdtype, zone[qname])
+
+        def process_domain(domain):
+            record = str(lookup.resolve(domain, "TXT")[0])
+            include = record.split("include:")[1].split()[0]
+            try:
+                lookup.resolve(f"_dmarc.{domain}", "TXT")
+                dmarc = True
+            except dns.resolver.NXDOMAIN:
+                dmarc = False
+            return {
+                "DOMAIN": domain,
+                "INCLUDE": str(lookup.resolve(include, "TXT")[0]),
+                "DMARC": dmarc,
+            }
+
+        results = []
+        cache = DNSCache()
+        with mock.patch("modules.engine.fetch_async", fake_fetch), mock.patch(
+            "modules.lookup.answer_cache", cache
+        ):
+            run_async(["example.com"], process_domain, results.append, 10)
+
+        self.assertEqual(
+            fetched, ["example.com", "_dmarc.example.com", "_spf.example.net"]
+        )
+        self.assertEqual(results[0]["INCLUDE"], '"v=spf1 ip4:192.0.2.0/24 -all"')
+        self.assertFalse(results[0]["DMARC"])
+        self.assertEqual(results[0]["DNS_QUERIES"], 3)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+    def test_a_lookup_misses_the_cache_once_however_many_passes_wait_for_it(self):
+        async def fake_fetch(qname, rdtype, nameservers, limit):
+            return dns.resolver.NXDOMAIN
+
+        def process_domain(domain):
+            lookups = [(f"s{i}._domainkey.{domain}", "TXT", None) for i in range(5)]
+            lookup.resolve_all(lookups, 2)
+            return {"DOMAIN": domain}
+
+        cache = DNSCache()
+        with mock.patch("modules.engine.fetch_async", fake_fetch), mock.patch(
+            "modules.lookup.answer_cache", cache
+        ):
+            run_async(["example.com"], process_domain, lambda _: None, 10)
+        self.assertEqual(cache.stats()["misses"], 5)
+
+
+class TestUDPMultiplexer(unittest.TestCase):
+    def test_matches_replies_and_ignores_unrelated_ones(self):
+        import asyncio
+
+        import dns.message
+
+        class Responder(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                query = dns.message.from_wire(data)
+                stray = dns.message.make_response(query)
+                stray.id = (query.id + 1) % 65536
+                self.transport.sendto(stray.to_wire(), addr)
+                self.transport.sendto(dns.message.make_response(query).to_wire(), addr)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(
+                Responder, local_addr=("127.0.0.1", 0)
+            )
+            port = transport.get_extra_info("sockname")[1]
+            try:
+                with UDPMultiplexer(sockets=2) as multiplexer:
+                    requests = [
+                        dns.message.make_query(f"d{i}.example.com", "TXT")
+                        for i in range(20)
+                    ]
+                    responses = await asyncio.gather(
+                        *(multiplexer.query(r, "127.0.0.1", 2, port) for r in requests)
+                    )
+                    return requests, responses, multiplexer.stats()
+            finally:
+                transport.close()
+
+        requests, responses, stats = asyncio.run(scenario())
+        for request, response in zip(requests, responses):
+            self.assertTrue(request.is_response(response))
+        self.assertEqual(stats["received"], 20)
+        self.assertEqual(stats["retransmitted"], 0)
+
+    def test_late_answer_to_a_retransmitted_query_is_taken(self):
+        import asyncio
+
+        import dns.message
+
+        class SlowResponder(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+                self.queries = 0
+
+            def datagram_received(self, data, addr):
+                self.queries += 1
+                if self.queries == 1:
+                    response = dns.message.make_response(dns.message.from_wire(data))
+                    asyncio.get_running_loop().call_later(
+                        0.3, self.transport.sendto, response.to_wire(), addr
+                    )
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(
+                SlowResponder, local_addr=("127.0.0.1", 0)
+            )
+            port = transport.get_extra_info("sockname")[1]
+            try:
+                with UDPMultiplexer(sockets=1, retransmits=2) as multiplexer:
+                    request = dns.message.make_query("example.com", "TXT")
+                    response = await multiplexer.query(request, "127.0.0.1", 1, port)
+                    return request, response, multiplexer.stats()
+            finally:
+                transport.close()
+
+        request, response, stats = asyncio.run(scenario())
+        self.assertEqual(response.question, request.question)
+        self.assertNotEqual(response.id, request.id)
+        self.assertEqual(stats["retransmitted"], 1)
+        self.assertEqual(stats["received"], 1)
+
+    def test_results_match_the_threads_engine(self):
+        import asyncio
+        import socket
+        import threading
+
+        import spoofy
+        from modules.synthetic import serve
+
+        zone = SyntheticZone(12, seed=3, truncate_rate=0.2)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        loop = asyncio.new_event_loop()
+        server = loop.create_task(serve(zone, "127.0.0.1", port))
+        thread = threading.Thread(
+            target=loop.run_until_complete, args=(asyncio.wait([server]),)
+        )
+        thread.start()
+        self.addCleanup(loop.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(loop.call_soon_threadsafe, server.cancel)
+        time.sleep(0.2)
+
+        def scan(engine):
+            pool = ResolverPool()
+            pool.redirect = ("127.0.0.1", port)
+            results = []
+            handle_result = spoofy.learning_selectors(results.append)
+            with mock.patch("modules.lookup.resolver_pool", pool), mock.patch.object(
+                lookup.answer_cache, "max_entries", 0
+            ), mock.patch.object(spoofy.selector_sweep, "hits", {}):
+                if engine == "udp":
+                    run_async(
+                        zone.domains, spoofy.process_domain, handle_result, 100, True
+                    )
+                else:
+                    for domain in zone.domains:
+                        handle_result(spoofy.process_domain(domain))
+                hits = dict(spoofy.selector_sweep.hits)
+            return hits, {
+                result["DOMAIN"]: {k: v for k, v in result.items() if k != "DNS_QUERIES"}
+                for result in results
+            }
+
+        self.assertEqual(scan("udp"), scan("threads"))
+
+
+class TestDNSRecording(unittest.TestCase):
+    def test_replays_what_was_recorded(self):
+        import os
+        import tempfile
+
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        recording = DNSRecording()
+        recording.record(path)
+        txt = dns.rrset.from_text("example.com.", 300, "IN", "TXT", '"v=spf1 -all"')
+        recording.save(("example.com", "TXT", ("1.1.1.1",)), txt, 300)
+        recording.save(("_dmarc.example.com", "TXT", None), dns.resolver.NXDOMAIN, 60)
+        recording.close()
+
+        replay = DNSRecording()
+        replay.replay(path)
+        rrset, ttl = replay.lookup(("example.com", "TXT", ("1.1.1.1",)))
+        self.assertEqual(rrset, txt)
+        self.assertEqual(ttl, 300)
+        self.assertEqual(
+            replay.lookup(("_dmarc.example.com", "TXT", None)),
+            (dns.resolver.NXDOMAIN, 60),
+        )
+        self.assertEqual(
+            replay.lookup(("example.com", "TXT", None)),
+            (dns.resolver.NoNameservers, 0),
+        )
+        self.assertEqual(replay.stats(), {"recorded": 0, "replayed": 2, "missing": 1})
+
+
+class TestSyntheticZone(unittest.TestCase):
+    def test_answers_nodata_nxdomain_and_truncation(self):
+        import dns.flags
+        import dns.message
+        import dns.rcode
+
+        zone = SyntheticZone(50, seed=1, nxdomain_rate=0.2, truncate_rate=0)
+        again = SyntheticZone(50, seed=1, nxdomain_rate=0.2, truncate_rate=0)
+        self.assertEqual(zone.records, again.records)
+        domain = next(d for d in zone.domains if d + "." in zone.apexes)
+        missing = next(d for d in zone.domains if d + "." not in zone.apexes)
+
+        def ask(name, tcp=False):
+            return zone.respond(dns.message.make_query(name, "TXT"), tcp)
+
+        self.assertEqual(ask(f"_domainkey.{domain}").rcode(), dns.rcode.NOERROR)
+        self.assertEqual(ask(f"_domainkey.{domain}").answer, [])
+        self.assertEqual(ask(f"nope._domainkey.{domain}").rcode(), dns.rcode.NXDOMAIN)
+        self.assertEqual(ask(missing).rcode(), dns.rcode.NXDOMAIN)
+
+        zone.truncated.add(domain + ".")
+        self.assertTrue(ask(f"_dmarc.{domain}").flags & dns.flags.TC)
+        self.assertFalse(ask(f"_dmarc.{domain}", tcp=True).flags & dns.flags.TC)
+
+
 if __name__ == "__main__":
     unittest.main()